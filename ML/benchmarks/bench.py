@@ -0,0 +1,229 @@
+"""
+Micro-benchmarks for the forecasting hot paths.
+
+Runs offline (no server, no network) against the site CSVs in
+Data_SIH_2025_with_blh and test_payload_2024.json, calling the server's own
+functions:
+
+    startup.*        load_site_store (CSV parse) and load_site_dates
+    prepare.*        prepare_features at 24 .. 8760 rows (ERA5 join, lags, spatial)
+    recursive.h*     the recursive branch of run_forecast (forecast_recursive) for
+                     a 24 / 72 / 168 hour horizon after two weeks of history
+    predict.b*       predict_single_step at batch sizes 1 .. 10k
+    format.*         format_data_response for a 168 hour forecast
+    pipeline.*       run_forecast_pipeline end to end on test_payload_2024.json
+
+Each benchmark is calibrated so one repeat runs for at least --min-time seconds.
+The best per-call time of --repeat repeats is compared against a JSON baseline,
+and the run fails (exit 1) when any benchmark is slower than the baseline by more
+than --threshold. Baselines depend on the machine, so save them on the machine
+that checks them:
+
+    python benchmarks/bench.py --save              # write benchmarks/baselines/baseline.json
+    python benchmarks/bench.py                     # compare against it
+    python benchmarks/bench.py -k predict --threshold 0.25 --artifacts /path/to/models
+
+Server settings are read from the environment as usual (INFERENCE_BACKEND,
+MICROBATCH_WINDOW_MS, ...). The model artifacts and the ERA5 timeseries are not
+part of the repo; point --artifacts at the directory holding
+production_{O3,NO2}_era5_spatial.json and --era5 at era5_station_timeseries.csv.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+import server  # noqa: E402
+
+DEFAULT_BASELINE = BENCH_DIR / "baselines" / "baseline.json"
+PAYLOAD_PATH = BENCH_DIR.parent / "test_payload_2024.json"
+BENCH_SITE = "1"
+HISTORY_HOURS = 14 * 24
+PREPARE_ROWS = [24, 168, 720, 2160, 8760]
+HORIZONS = [24, 72, 168]
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+
+def site_frame(site_id: str = BENCH_SITE) -> pd.DataFrame:
+    """Hourly rows of a site's training CSV in time order, as a typed request frame."""
+    df = pd.read_csv(server.DATA_DIR / f"site_{site_id}_train_data.csv")
+    df["datetime"] = pd.to_datetime(df[["year", "month", "day", "hour"]].astype(int))
+    df = df.drop_duplicates("datetime").sort_values("datetime").reset_index(drop=True)
+    df["datetime"] = df["datetime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    df["site"] = server.site_number(site_id)
+    return server.typed_input(df)
+
+
+def with_horizon(df: pd.DataFrame, horizon: int) -> pd.DataFrame:
+    """HISTORY_HOURS of history followed by `horizon` rows without targets."""
+    rows = df.iloc[-(HISTORY_HOURS + horizon):].reset_index(drop=True).copy()
+    rows.loc[rows.index[-horizon:], ["O3_target", "NO2_target"]] = np.nan
+    return rows
+
+
+def build_benchmarks() -> List[Tuple[str, Callable[[], object]]]:
+    loop = asyncio.new_event_loop()
+    df = site_frame()
+    benches = [
+        ("startup.load_site_store", server.load_site_store),
+        ("startup.load_site_dates", server.load_site_dates),
+    ]
+    for n in PREPARE_ROWS:
+        rows = df.iloc[-n:].reset_index(drop=True)
+        benches.append((f"prepare.rows{n}", lambda rows=rows: server.prepare_features(rows)))
+
+    for h in HORIZONS:
+        rows = with_horizon(df, h)
+        benches.append((f"recursive.h{h}", lambda rows=rows: server.forecast_recursive(rows)))
+
+    prepared = server.prepare_features(df.iloc[-max(BATCH_SIZES):].reset_index(drop=True))
+    for n in BATCH_SIZES:
+        rows = prepared.iloc[:n].copy()
+        benches.append((f"predict.b{n}", lambda rows=rows: server.predict_single_step(rows)))
+
+    forecast_df, forecast_preds = loop.run_until_complete(server.run_forecast(with_horizon(df, 168), BENCH_SITE))
+    benches.append(("format.h168", lambda: server.format_data_response(forecast_df.copy(), forecast_preds)))
+    benches.append(("format.h168_metrics", lambda: server.format_data_response(forecast_df.copy(), forecast_preds, True)))
+
+    payload = json.loads(PAYLOAD_PATH.read_text())
+    payload_df = server.typed_input(pd.DataFrame(payload["data"]))
+    site_id = str(payload["site_id"])
+    benches.append(("pipeline.test_payload_2024",
+                    lambda: loop.run_until_complete(server.run_forecast_pipeline(payload_df.copy(), site_id))))
+    return benches
+
+
+def measure(fn: Callable[[], object], repeat: int, min_time: float) -> Dict[str, float]:
+    """Per-call seconds: calibrate loops so a repeat takes >= min_time, then time `repeat` repeats."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9)))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        times.append((time.perf_counter() - start) / loops)
+    return {"best": min(times), "median": statistics.median(times), "loops": loops, "repeat": repeat}
+
+
+def environment() -> Dict[str, str]:
+    import xgboost as xgb
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "xgboost": xgb.__version__,
+        "model_version": server.model_version,
+        "inference": {t: b.name for t, b in server.inference.items()},
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Print current vs baseline; returns the names that regressed beyond `threshold`."""
+    regressions = []
+    print(f"\n{'benchmark':32} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:32} {'-':>12} {fmt(result['best']):>12} {'new':>8}")
+            continue
+        change = result["best"] / base["best"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:32} {fmt(base['best']):>12} {fmt(result['best']):>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def fmt(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown vs the baseline (0.15 = 15%%)")
+    parser.add_argument("--output", type=Path, help="Also write the results of this run here")
+    parser.add_argument("--artifacts", type=Path, default=server.ARTIFACT_DIR, help="Model artifact directory")
+    parser.add_argument("--era5", type=Path, default=server.ERA5_DATA_PATH, help="ERA5 station timeseries CSV")
+    args = parser.parse_args()
+
+    logging.getLogger("AirQualityServer").setLevel(logging.WARNING)
+    server.ARTIFACT_DIR = args.artifacts
+    server.ERA5_DATA_PATH = args.era5
+    server.load_startup_state()
+    server.load_models()
+    if not server.models:
+        sys.exit(f"No model artifacts found in {args.artifacts} (use --artifacts)")
+
+    results = {}
+    for name, fn in build_benchmarks():
+        if args.filter not in name:
+            continue
+        results[name] = measure(fn, args.repeat, args.min_time)
+        r = results[name]
+        print(f"{name:32} best {fmt(r['best']):>10}  median {fmt(r['median']):>10}  ({r['loops']} loops x {r['repeat']})")
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.save:
+        if args.baseline.exists() and args.filter:
+            # Partial runs only replace the benchmarks they ran
+            report["results"] = {**json.loads(args.baseline.read_text())["results"], **results}
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save to create one")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    regressions = compare(results, baseline["results"], args.threshold)
+    if baseline["environment"].get("machine") != report["environment"]["machine"]:
+        print(f"\n⚠️ Baseline was recorded on {baseline['environment'].get('machine')}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}: "
+              + ", ".join(regressions))
+        sys.exit(1)
+    print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Load generator for the forecast server with latency percentiles per endpoint.
+
+Drives the FastAPI app in-process through httpx's ASGI transport (startup runs
+through the app's lifespan, so models and data load exactly as under uvicorn),
+or a running server with --url. The traffic is a weighted mix of
+
+    by-date   POST /forecast/by-date/ for random (site, predictable date) pairs from /sites/
+    json      POST /forecast/json/ with `--history` hours of a site CSV plus `--horizon`
+              hours to forecast
+    plots     the /plots/*/json/ endpoints with the same bodies, and the /plots/*/file/
+              endpoints with them as CSV uploads
+    ws        one message on a fresh /ws/predict/ connection (connect + forecast + close)
+
+Bodies are cut from random windows of the site training CSVs and encoded before
+the run starts, so building them costs nothing during the measurement.
+
+Without --rate, `--concurrency` clients send requests back to back (closed loop).
+With --rate, requests arrive as a Poisson process at that many per second, with
+at most `--concurrency` in flight. Latency is then measured from the scheduled
+arrival, so time spent queueing behind a saturated server is counted. Requests
+finishing within the first --warmup seconds are not counted.
+
+The server is configured through its usual environment variables, so execution
+modes are compared by running the same mix under different settings:
+
+    python benchmarks/loadtest.py --duration 60 --concurrency 16
+    FORECAST_WORKERS=4 python benchmarks/loadtest.py --duration 60 --concurrency 16
+    FORECAST_CACHE_MB=0 python benchmarks/loadtest.py --mix by-date=1 --rate 50
+    python benchmarks/loadtest.py --url http://localhost:8000 --mix json=1,ws=1 --json report.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import httpx
+import numpy as np
+import pandas as pd
+
+try:
+    import websockets
+except ImportError:  # pragma: no cover - only needed for ws traffic against --url
+    websockets = None
+
+BENCH_DIR = Path(__file__).resolve().parent
+DATA_DIR = BENCH_DIR.parent / "Data_SIH_2025_with_blh"
+DEFAULT_MIX = "by-date=4,json=3,plots=2,ws=1"
+PLOT_VIEWS = ["performance", "diagnostic", "timeseries", "extreme"]
+SITES = [str(s) for s in range(1, 8)]
+
+
+class Body(NamedTuple):
+    site_id: str
+    json: bytes  # {"site_id", "data"} request body
+    csv: bytes  # the same rows for the /file/ endpoints
+
+
+class Sample(NamedTuple):
+    endpoint: str
+    latency: float
+    error: Optional[str]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in ("by-date", "json", "plots", "ws"):
+            raise SystemExit(f"Unknown traffic kind {kind!r} in --mix")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def build_bodies(data_dir: Path, history: int, horizon: int, per_site: int, rng: random.Random) -> List[Body]:
+    """`per_site` random windows of each site's training rows with the last `horizon` targets blanked."""
+    bodies = []
+    for site_id in SITES:
+        path = data_dir / f"site_{site_id}_train_data.csv"
+        if not path.exists():
+            continue
+        df = pd.read_csv(path)
+        df["datetime"] = pd.to_datetime(df[["year", "month", "day", "hour"]].astype(int))
+        df = df.drop_duplicates("datetime").sort_values("datetime").reset_index(drop=True)
+        df["datetime"] = df["datetime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        n = history + horizon
+        for _ in range(per_site):
+            start = rng.randrange(0, max(len(df) - n, 1))
+            rows = df.iloc[start:start + n].copy()
+            if horizon:
+                rows.loc[rows.index[-horizon:], ["O3_target", "NO2_target"]] = np.nan
+            records = rows.to_json(orient="records")
+            bodies.append(Body(
+                site_id,
+                f'{{"site_id": "{site_id}", "data": {records}}}'.encode(),
+                rows.to_csv(index=False).encode(),
+            ))
+    if not bodies:
+        raise SystemExit(f"No site_*_train_data.csv files in {data_dir}")
+    return bodies
+
+
+class AsgiWebSocket:
+    """Minimal in-process WebSocket client for an ASGI app (httpx's transport is HTTP only)."""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"loadtest")], "client": ("127.0.0.1", 0), "server": ("loadtest", 80),
+            "subprotocols": [],
+        }
+        await self.inbox.put({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(scope, self.inbox.get, self.outbox.put))
+        message = await self._next()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"WebSocket rejected: {message}")
+        return self
+
+    async def _next(self) -> Dict[str, Any]:
+        get = asyncio.ensure_future(self.outbox.get())
+        done, _ = await asyncio.wait({get, self.task}, return_when=asyncio.FIRST_COMPLETED)
+        if get in done:
+            return get.result()
+        get.cancel()
+        self.task.result()
+        raise ConnectionError("WebSocket closed by the server")
+
+    async def send(self, text: str):
+        await self.inbox.put({"type": "websocket.receive", "text": text})
+
+    async def recv(self) -> str:
+        message = await self._next()
+        if message["type"] == "websocket.close":
+            raise ConnectionError(f"WebSocket closed with code {message.get('code')}")
+        return message.get("text") or message.get("bytes", b"").decode()
+
+    async def __aexit__(self, *exc):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await asyncio.wait_for(self.task, 5)
+        except Exception:
+            self.task.cancel()
+
+
+class Traffic:
+    """Picks the next request of the mix and runs it."""
+
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, float], bodies: List[Body],
+                 dates: List[tuple], rng: random.Random, app=None, url: Optional[str] = None):
+        if "by-date" in mix and not dates:
+            raise SystemExit("/sites/ returned no predictable dates for by-date traffic")
+        if "ws" in mix and app is None and websockets is None:
+            raise SystemExit("ws traffic against --url needs the `websockets` package")
+        self.client = client
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.bodies = bodies
+        self.dates = dates
+        self.rng = rng
+        self.app = app
+        self.ws_url = url.replace("http", "ws", 1).rstrip("/") + "/ws/predict/" if url else None
+
+    def pick(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        if kind == "by-date":
+            site_id, date = self.rng.choice(self.dates)
+            body = json.dumps({"site_id": site_id, "forecast_date": date}).encode()
+            return "/forecast/by-date/", self.post_json("/forecast/by-date/", body)
+        body = self.rng.choice(self.bodies)
+        if kind == "json":
+            return "/forecast/json/", self.post_json("/forecast/json/", body.json)
+        if kind == "plots":
+            view = self.rng.choice(PLOT_VIEWS)
+            if self.rng.random() < 0.5:
+                path = f"/plots/{view}/json/"
+                return path, self.post_json(path, body.json)
+            path = f"/plots/{view}/file/"
+            return path, self.post_file(path, body)
+        return "/ws/predict/", self.ws_predict(body.json.decode())
+
+    async def post_json(self, path: str, body: bytes) -> Optional[str]:
+        r = await self.client.post(path, content=body, headers={"content-type": "application/json"})
+        await r.aread()
+        return None if r.status_code < 400 else f"HTTP {r.status_code}"
+
+    async def post_file(self, path: str, body: Body) -> Optional[str]:
+        r = await self.client.post(path, data={"site_id": body.site_id},
+                                   files={"file": ("input.csv", body.csv, "text/csv")})
+        await r.aread()
+        return None if r.status_code < 400 else f"HTTP {r.status_code}"
+
+    async def ws_predict(self, text: str) -> Optional[str]:
+        if self.app is not None:
+            async with AsgiWebSocket(self.app, "/ws/predict/") as ws:
+                await ws.send(text)
+                reply = await ws.recv()
+        else:
+            async with websockets.connect(self.ws_url, max_size=None) as ws:
+                await ws.send(text)
+                reply = await ws.recv()
+        return None if "dates" in json.loads(reply) else "bad reply"
+
+
+async def timed(endpoint: str, request, scheduled: float, samples: List[Sample], counted_from: float):
+    try:
+        error = await request
+    except Exception as e:
+        error = type(e).__name__
+    if time.perf_counter() >= counted_from:
+        samples.append(Sample(endpoint, time.perf_counter() - scheduled, error))
+
+
+async def closed_loop(traffic: Traffic, concurrency: int, end: float, counted_from: float) -> List[Sample]:
+    samples: List[Sample] = []
+
+    async def client():
+        while time.perf_counter() < end:
+            endpoint, request = traffic.pick()
+            await timed(endpoint, request, time.perf_counter(), samples, counted_from)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples
+
+
+async def open_loop(traffic: Traffic, rate: float, concurrency: int, end: float, counted_from: float,
+                    rng: random.Random) -> List[Sample]:
+    samples: List[Sample] = []
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def arrival(endpoint, request, scheduled):
+        async with slots:
+            await timed(endpoint, request, scheduled, samples, counted_from)
+
+    scheduled = time.perf_counter()
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled >= end:
+            break
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        endpoint, request = traffic.pick()
+        task = asyncio.create_task(arrival(endpoint, request, scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def summarize(samples: List[Sample], window: float) -> Dict[str, Dict[str, Any]]:
+    groups: Dict[str, List[Sample]] = {}
+    for s in samples:
+        groups.setdefault(s.endpoint, []).append(s)
+    groups["all"] = samples
+    report = {}
+    for endpoint, group in groups.items():
+        latencies = np.array([s.latency for s in group]) * 1000
+        errors: Dict[str, int] = {}
+        for s in group:
+            if s.error:
+                errors[s.error] = errors.get(s.error, 0) + 1
+        report[endpoint] = {
+            "requests": len(group),
+            "throughput": len(group) / window,
+            "error_rate": sum(errors.values()) / len(group) if group else 0.0,
+            "errors": errors,
+            **({
+                "mean_ms": float(latencies.mean()),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "max_ms": float(latencies.max()),
+            } if len(group) else {}),
+        }
+    return report
+
+
+def print_report(report: Dict[str, Dict[str, Any]]):
+    print(f"\n{'endpoint':28} {'reqs':>7} {'req/s':>8} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, r in sorted(report.items(), key=lambda item: (item[0] == "all", item[0])):
+        if not r["requests"]:
+            continue
+        print(f"{endpoint:28} {r['requests']:>7} {r['throughput']:>8.1f} {r['error_rate'] * 100:>6.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+        for error, count in r["errors"].items():
+            print(f"{'':28}   {count} x {error}")
+
+
+@asynccontextmanager
+async def target(args):
+    """(httpx client, ASGI app or None) for --url or the in-process server."""
+    url, timeout = args.url, args.timeout
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+            yield client, None
+        return
+    sys.path.insert(0, str(BENCH_DIR.parent))
+    import server
+
+    if args.artifacts:
+        server.ARTIFACT_DIR = args.artifacts
+    if args.era5:
+        server.ERA5_DATA_PATH = args.era5
+    async with server.lifespan(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            yield client, server.app
+
+
+async def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    bodies = build_bodies(args.data, args.history, args.horizon, args.bodies, rng)
+    async with target(args) as (client, app):
+        dates = []
+        if "by-date" in mix:
+            sites = (await client.get("/sites/")).json()
+            dates = [(s["id"], d) for s in sites for d in s["predictable_dates"]]
+        traffic = Traffic(client, mix, bodies, dates, rng, app, args.url)
+        print(f"Load: mix {mix}, {'rate %g/s' % args.rate if args.rate else 'closed loop'}, "
+              f"concurrency {args.concurrency}, {args.duration:g}s (+{args.warmup:g}s warm-up), "
+              f"{'in-process' if app is not None else args.url}")
+        start = time.perf_counter()
+        counted_from = start + args.warmup
+        end = counted_from + args.duration
+        if args.rate:
+            samples = await open_loop(traffic, args.rate, args.concurrency, end, counted_from, rng)
+        else:
+            samples = await closed_loop(traffic, args.concurrency, end, counted_from)
+        window = max(time.perf_counter(), end) - counted_from
+    return {
+        "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "endpoints": summarize(samples, window),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running server (default: drive the app in-process)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted traffic kinds, e.g. by-date=4,json=3,plots=2,ws=1")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients (closed loop) or max in-flight requests")
+    parser.add_argument("--rate", type=float, default=0, help="Arrivals per second (0 = closed loop)")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds run before measuring")
+    parser.add_argument("--history", type=int, default=168, help="History hours per body")
+    parser.add_argument("--horizon", type=int, default=24, help="Hours to forecast per body")
+    parser.add_argument("--bodies", type=int, default=8, help="Distinct bodies per site")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--data", type=Path, default=DATA_DIR, help="Directory of the site CSVs")
+    parser.add_argument("--artifacts", type=Path, help="Model artifact directory (in-process only)")
+    parser.add_argument("--era5", type=Path, help="ERA5 station timeseries CSV (in-process only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Write the report here")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    print_report(report["endpoints"])
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Columnar request bodies for the forecast / plot endpoints.
+
+Besides the row-oriented JSON payload ({"site_id", "data": [{...}, ...]}), the
+endpoints accept a whole table in one binary body, selected by Content-Type:
+
+    application/vnd.apache.arrow.stream   Arrow IPC stream
+    application/vnd.apache.parquet        Parquet file (also application/x-parquet)
+    application/x-npz                     NumPy .npz, one 1-D array per column
+
+Columns are mapped into pandas without per-row validation or string coercion;
+numeric Arrow/Parquet columns without nulls are handed over zero-copy where
+pyarrow allows it, NPZ arrays are used as-is.
+"""
+
+import io
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+NPZ = "application/x-npz"
+CONTENT_TYPES = {
+    ARROW_STREAM: "arrow",
+    PARQUET: "parquet",
+    "application/x-parquet": "parquet",
+    NPZ: "npz",
+}
+
+
+class ColumnarDecodeError(ValueError):
+    """The body could not be decoded as the declared columnar format."""
+
+
+def media_type(content_type: str) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def is_columnar(content_type: str) -> bool:
+    return media_type(content_type) in CONTENT_TYPES
+
+
+def _arrow_to_frame(table) -> pd.DataFrame:
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def decode_body(body: bytes, content_type: str) -> pd.DataFrame:
+    kind = CONTENT_TYPES.get(media_type(content_type))
+    if kind is None:
+        raise ColumnarDecodeError(f"Unsupported content type: {content_type}")
+    if kind in ("arrow", "parquet") and pa is None:
+        raise ColumnarDecodeError(f"{media_type(content_type)} bodies need pyarrow installed")
+    try:
+        if kind == "arrow":
+            df = _arrow_to_frame(pa.ipc.open_stream(pa.py_buffer(body)).read_all())
+        elif kind == "parquet":
+            df = _arrow_to_frame(pq.read_table(pa.BufferReader(body)))
+        else:
+            with np.load(io.BytesIO(body), allow_pickle=False) as npz:
+                columns: Dict[str, np.ndarray] = {name: npz[name] for name in npz.files}
+            bad = [name for name, arr in columns.items() if arr.ndim != 1]
+            if bad:
+                raise ColumnarDecodeError(f"NPZ columns must be 1-D arrays: {bad}")
+            df = pd.DataFrame(columns, copy=False)
+    except ColumnarDecodeError:
+        raise
+    except Exception as e:
+        raise ColumnarDecodeError(f"Invalid {kind} body: {e}")
+    return normalize_datetime(df)
+
+
+def normalize_datetime(df: pd.DataFrame) -> pd.DataFrame:
+    """`datetime` as datetime64[ns] (naive), like pd.to_datetime on the JSON strings."""
+    if "datetime" not in df.columns:
+        return df
+    col = df["datetime"]
+    if pd.api.types.is_datetime64_any_dtype(col):
+        if getattr(col.dt, "tz", None) is None and col.dtype != "datetime64[ns]":
+            df["datetime"] = col.astype("datetime64[ns]")
+    else:
+        df["datetime"] = pd.to_datetime(col)
+    return df
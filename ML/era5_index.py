@@ -0,0 +1,81 @@
+"""
+Dense, hour-indexed ERA5 station table.
+
+prepare_features used to left-merge every request against the full ERA5
+timeseries on (site, datetime), hashing the whole table each time. Here each
+site's series is laid out once as an (hour offset x variable) float64 block
+starting at the site's first hour, so the row for a timestamp is
+
+    (epoch hours - first hour), when the timestamp falls on a whole hour
+
+and joining the ERA5 columns is one fancy-index gather per site. Hours missing
+from the file, timestamps outside the covered range or off the hour, and unknown
+sites come back as NaN, exactly like unmatched rows of the left merge.
+"""
+
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("AirQualityServer")
+
+NS_PER_HOUR = 3_600_000_000_000
+
+
+def epoch_hours(times) -> Tuple[np.ndarray, np.ndarray]:
+    """(hours since epoch, mask of whole-hour non-NaT timestamps) for datetime-like values."""
+    ns = pd.DatetimeIndex(times).asi8
+    valid = (ns != np.iinfo(np.int64).min) & (ns % NS_PER_HOUR == 0)
+    return ns // NS_PER_HOUR, valid
+
+
+class ERA5Index:
+    def __init__(self, columns: List[str], blocks: Dict[int, Tuple[int, np.ndarray]]):
+        self.columns = list(columns)
+        self.blocks = blocks  # site -> (first epoch hour, values[hour offset, variable])
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "ERA5Index":
+        columns = [c for c in df.columns if c not in ("site", "datetime")]
+        hours, valid = epoch_hours(pd.to_datetime(df["datetime"]))
+        sites = pd.to_numeric(df["site"], errors="coerce").to_numpy(dtype=np.float64)
+        values = df[columns].to_numpy(dtype=np.float64)
+
+        blocks = {}
+        for site in np.unique(sites[valid & ~np.isnan(sites)]):
+            rows = np.flatnonzero(valid & (sites == site))
+            h = hours[rows]
+            first = int(h.min())
+            block = np.full((int(h.max()) - first + 1, len(columns)), np.nan)
+            # Rows are written in file order, so for a duplicated hour the last one wins
+            block[h - first] = values[rows]
+            blocks[int(site)] = (first, block)
+        return cls(columns, blocks)
+
+    @property
+    def n_hours(self) -> int:
+        return sum(block.shape[0] for _, block in self.blocks.values())
+
+    def gather(self, sites, times) -> np.ndarray:
+        """(n, len(columns)) float64 ERA5 values for row-wise (site, datetime) keys."""
+        sites = pd.to_numeric(pd.Series(sites), errors="coerce").to_numpy(dtype=np.float64)
+        hours, valid = epoch_hours(times)
+        out = np.full((len(sites), len(self.columns)), np.nan)
+        for site in np.unique(sites[valid & ~np.isnan(sites)]):
+            if site not in self.blocks:
+                continue
+            first, block = self.blocks[int(site)]
+            rows = np.flatnonzero(valid & (sites == site))
+            offset = hours[rows] - first
+            inside = (offset >= 0) & (offset < block.shape[0])
+            out[rows[inside]] = block[offset[inside]]
+        return out
+
+    def join(self, df: pd.DataFrame) -> pd.DataFrame:
+        """ERA5 columns appended to df (in place), like a left merge on site + datetime."""
+        values = self.gather(df["site"].to_numpy(), df["datetime"])
+        for j, col in enumerate(self.columns):
+            df[col] = values[:, j]
+        return df
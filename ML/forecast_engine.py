@@ -0,0 +1,270 @@
+"""
+Incremental recursive forecasting engine.
+
+The recursive branch used to re-run prepare_features on a 60-row window for
+every future hour. Only the lag / rolling-mean features actually depend on
+earlier predictions, so here each site keeps its last 24 target values in a
+fixed-size ring buffer (with a running NaN-aware sum for the 24h mean) and the
+feature row for a step is patched directly inside a preallocated feature
+matrix. Everything else (time features, ERA5, forecasts...) is computed once,
+up front, by the normal batch feature pass.
+
+Sites advance in lockstep: at step k every site that still has a k-th future
+row contributes one row to the same matrix, so there is one predict call per
+step regardless of how many sites are being forecast. With a spatial engine,
+the cross-site lag1 features of each step are refreshed from the other sites'
+latest values (observed or just predicted) at the same timestamp.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from spatial import POLLUTANTS, SpatialFeatureEngine, lag1_col, spatial_cols
+
+TARGETS = ["O3_target", "NO2_target"]
+LAG_HOURS = [1, 3, 6, 12, 24]
+ROLL_WINDOW = 24
+STATE_SIZE = max(max(LAG_HOURS), ROLL_WINDOW)
+
+PredictFn = Callable[[np.ndarray], Dict[str, np.ndarray]]
+
+
+def target_prefix(target: str) -> str:
+    return target.replace("_target", "")
+
+
+def lag_col(target: str, lag: int) -> str:
+    return f"{target_prefix(target)}_lag_{lag}h"
+
+
+def roll_col(target: str) -> str:
+    return f"{target_prefix(target)}_roll{ROLL_WINDOW}_mean"
+
+
+class TargetRing:
+    """Last `size` values of one target, with O(1) push / lag / rolling mean."""
+
+    __slots__ = ("buf", "size", "pos", "total", "count")
+
+    def __init__(self, size: int = STATE_SIZE):
+        self.buf = np.full(size, np.nan)
+        self.size = size
+        self.pos = 0  # next write slot == oldest value
+        self.total = 0.0
+        self.count = 0
+
+    def push(self, value: float):
+        old = self.buf[self.pos]
+        if old == old:  # not NaN
+            self.total -= old
+            self.count -= 1
+        self.buf[self.pos] = value
+        if value == value:
+            self.total += value
+            self.count += 1
+        self.pos = (self.pos + 1) % self.size
+
+    def copy(self) -> "TargetRing":
+        ring = TargetRing(self.size)
+        ring.buf[:] = self.buf
+        ring.pos, ring.total, ring.count = self.pos, self.total, self.count
+        return ring
+
+    def seed(self, values: np.ndarray):
+        for v in values[-self.size:]:
+            self.push(float(v))
+
+    def lag(self, k: int) -> float:
+        """Value k steps back (k=1 is the most recent push)."""
+        return self.buf[(self.pos - k) % self.size]
+
+    def mean(self) -> float:
+        """Mean of the non-NaN values in the window (pandas rolling(min_periods=1))."""
+        return self.total / self.count if self.count else np.nan
+
+
+class FeatureLayout:
+    """Positions of the state-derived columns inside the feature matrix."""
+
+    def __init__(self, feature_cols: Sequence[str], targets: Iterable[str] = TARGETS):
+        index = {c: i for i, c in enumerate(feature_cols)}
+        self.lags: Dict[str, List[tuple]] = {}
+        self.roll: Dict[str, int] = {}
+        for t in targets:
+            self.lags[t] = [(lag, index[lag_col(t, lag)]) for lag in LAG_HOURS if lag_col(t, lag) in index]
+            if roll_col(t) in index:
+                self.roll[t] = index[roll_col(t)]
+        # {pollutant: (lag1 col, [mean, std, idw, diff] cols)}
+        self.spatial = {
+            p: (index[lag1_col(p)], [index[c] for c in spatial_cols(p)])
+            for p in POLLUTANTS
+            if lag1_col(p) in index and all(c in index for c in spatial_cols(p))
+        }
+
+
+class SiteState:
+    """Per-site recursive state: one ring per target."""
+
+    def __init__(self, targets: Iterable[str] = TARGETS, size: int = STATE_SIZE):
+        self.rings = {t: TargetRing(size) for t in targets}
+
+    def push(self, values: Dict[str, float]):
+        for t, ring in self.rings.items():
+            ring.push(values[t])
+
+    def copy(self) -> "SiteState":
+        state = SiteState(())
+        state.rings = {t: ring.copy() for t, ring in self.rings.items()}
+        return state
+
+    def observe(self, targets: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Lag / rolling feature columns for a run of observed rows, pushing each row
+        after its features are read (the shift-based lags of prepare_features).
+        """
+        n = len(next(iter(targets.values()))) if targets else 0
+        cols = {}
+        for t in self.rings:
+            for lag in LAG_HOURS:
+                cols[lag_col(t, lag)] = np.empty(n)
+            cols[roll_col(t)] = np.empty(n)
+        for i in range(n):
+            for t, ring in self.rings.items():
+                for lag in LAG_HOURS:
+                    cols[lag_col(t, lag)][i] = ring.lag(lag)
+                cols[roll_col(t)][i] = ring.mean()
+            self.push({t: float(targets[t][i]) for t in self.rings})
+        return cols
+
+    def write_features(self, row: np.ndarray, layout: FeatureLayout):
+        for t, ring in self.rings.items():
+            for lag, col in layout.lags.get(t, ()):
+                row[col] = ring.lag(lag)
+            col = layout.roll.get(t)
+            if col is not None:
+                row[col] = ring.mean()
+
+
+def update_spatial(
+    X: np.ndarray,
+    rows: np.ndarray,
+    times: np.ndarray,
+    sites: np.ndarray,
+    layout: FeatureLayout,
+    spatial: SpatialFeatureEngine,
+):
+    """Recompute the spatial columns of `rows` from the lag1 columns currently in X."""
+    if len(rows) == 0:
+        return
+    lag1 = {p: X[:, col] for p, (col, _) in layout.spatial.items()}
+    feats = spatial.compute_frame(times, sites, lag1)
+    for p, (_, cols) in layout.spatial.items():
+        for col, name in zip(cols, spatial_cols(p)):
+            X[rows, col] = feats[name][rows]
+
+
+def _step_spatial(block, active, X, times, sites, rows_by_time, layout, spatial):
+    """Spatial columns for one lockstep step, one mat-vec per timestamp."""
+    groups: Dict = {}
+    for j, (_, row) in enumerate(active):
+        groups.setdefault(times[row], []).append((j, row))
+    for t, members in groups.items():
+        rows = rows_by_time[t]
+        pos = {r: i for i, r in enumerate(rows.tolist())}
+        lag1 = {}
+        for p, (col, _) in layout.spatial.items():
+            vals = X[rows, col].astype(np.float64)
+            for j, row in members:
+                vals[pos[row]] = block[j, col]
+            lag1[p] = vals
+        feats = spatial.compute(sites[rows], lag1)
+        for p, (_, cols) in layout.spatial.items():
+            for col, name in zip(cols, spatial_cols(p)):
+                for j, row in members:
+                    block[j, col] = feats[name][pos[row]]
+
+
+def run_recursive(
+    X: np.ndarray,
+    sites: np.ndarray,
+    targets: Dict[str, np.ndarray],
+    future: np.ndarray,
+    layout: FeatureLayout,
+    predict_fn: PredictFn,
+    times: Optional[np.ndarray] = None,
+    spatial: Optional[SpatialFeatureEngine] = None,
+    states: Optional[Dict] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Recursively forecast the `future` rows of X, all sites in lockstep.
+
+    X       : (n, F) feature matrix, rows grouped by site and time-ordered within a site.
+              Future rows get their lag/rolling columns rewritten in place.
+    sites   : (n,) site key of each row
+    targets : {target: (n,) float array} observed values, NaN where unknown.
+              Future rows are overwritten with the predictions (in place).
+    future  : (n,) bool mask of rows to forecast
+    times   : (n,) timestamp of each row (needed with `spatial`)
+    spatial : refresh the cross-site lag1 features at every step
+    states  : {site: SiteState} to continue from (advanced in place) instead of
+              seeding from the rows before the site's first future row
+    Returns {target: (n,) array} with the step predictions on future rows, NaN elsewhere.
+    """
+    n = X.shape[0]
+    names = list(targets)
+    step_preds = {t: np.full(n, np.nan) for t in names}
+
+    # Per-site history seeding + list of future rows
+    sequences = []
+    for site in dict.fromkeys(sites.tolist()):
+        rows = np.flatnonzero(sites == site)
+        fut = rows[future[rows]]
+        if len(fut) == 0:
+            continue
+        if states is not None and site in states:
+            state = states[site]
+        else:
+            state = SiteState(names)
+            hist = rows[rows < fut[0]]
+            for t in names:
+                state.rings[t].seed(targets[t][hist])
+        sequences.append((state, fut))
+
+    if not sequences:
+        return step_preds
+
+    block = np.empty((len(sequences), X.shape[1]), dtype=X.dtype)
+    horizon = max(len(fut) for _, fut in sequences)
+
+    use_spatial = spatial is not None and times is not None and bool(layout.spatial)
+    if use_spatial:
+        time_keys = times.tolist()
+        rows_by_time: Dict = {}
+        for row, t in enumerate(time_keys):
+            rows_by_time.setdefault(t, []).append(row)
+        rows_by_time = {t: np.array(r) for t, r in rows_by_time.items()}
+
+    for k in range(horizon):
+        active = [(state, fut[k]) for state, fut in sequences if k < len(fut)]
+        m = len(active)
+        for j, (state, row) in enumerate(active):
+            block[j] = X[row]
+            state.write_features(block[j], layout)
+        if use_spatial:
+            _step_spatial(block, active, X, time_keys, sites, rows_by_time, layout, spatial)
+
+        preds = predict_fn(block[:m])
+
+        for j, (state, row) in enumerate(active):
+            X[row] = block[j]
+            values = {}
+            for t in names:
+                if t in preds:
+                    v = float(preds[t][j])
+                    targets[t][row] = v
+                    step_preds[t][row] = v
+                values[t] = targets[t][row]
+            state.push(values)
+
+    return step_preds
@@ -0,0 +1,318 @@
+"""
+Inference backends for the production XGBoost models.
+
+XGBRegressor.predict goes through the sklearn wrapper (validation, DataFrame ->
+DMatrix conversion, feature-name checks) on every call, which dominates the
+1-row calls of the recursive loop. Every backend here takes a FEATURE_COLS
+ordered matrix and returns float32 predictions:
+
+    booster   native Booster.inplace_predict on a contiguous float32 array
+    numpy     vectorised evaluation of the tree arrays from the booster JSON
+    compiled  treelite / tl2cgen ahead-of-time compiled shared library
+              (optional: only when tl2cgen and a C toolchain are available)
+
+select_backend() checks every candidate against the booster on probe data and
+times it per batch size; the returned router sends each call to the fastest
+engine for its batch size.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("AirQualityServer")
+
+BACKEND_NAMES = ["booster", "numpy", "compiled"]
+BENCH_BATCH_SIZES = [1, 8, 64, 512]
+# Objectives whose prediction is the raw margin (no link function)
+IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror", "reg:quantileerror"}
+
+
+def as_float32(X) -> np.ndarray:
+    """Contiguous float32 view/copy of a matrix or DataFrame."""
+    return np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+
+
+def _iteration_range(booster) -> Tuple[int, int]:
+    """Same tree range XGBRegressor.predict uses (best_iteration after early stopping)."""
+    best = booster.attr("best_iteration")
+    return (0, int(best) + 1) if best is not None else (0, 0)
+
+
+class InferenceBackend:
+    name = "base"
+
+    def predict(self, X) -> np.ndarray:
+        raise NotImplementedError
+
+
+class BoosterBackend(InferenceBackend):
+    """Native booster, no sklearn wrapper or DMatrix construction."""
+
+    name = "booster"
+
+    def __init__(self, model):
+        self.booster = model.get_booster()
+        self.iteration_range = _iteration_range(self.booster)
+
+    def predict(self, X) -> np.ndarray:
+        out = self.booster.inplace_predict(
+            as_float32(X), iteration_range=self.iteration_range, validate_features=False
+        )
+        return np.asarray(out, dtype=np.float32).reshape(-1)
+
+
+class NumpyTreeBackend(InferenceBackend):
+    """
+    All trees flattened into node arrays and walked level by level for every
+    (row, tree) pair at once. Leaves point at themselves, so a fixed number of
+    steps (max depth) reaches every leaf. Splits use float32 `x < threshold`
+    with NaN following the default direction, and leaves are summed in tree
+    order on top of base_score, as the XGBoost CPU predictor does.
+    """
+
+    name = "numpy"
+
+    def __init__(self, model):
+        booster = model.get_booster()
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in IDENTITY_OBJECTIVES:
+            raise ValueError(f"objective {objective} is not supported")
+        gbm = learner["gradient_booster"]
+        if gbm["name"] != "gbtree":
+            raise ValueError(f"booster {gbm['name']} is not supported")
+        if int(learner["learner_model_param"].get("num_target", "1")) > 1:
+            raise ValueError("multi-target models are not supported")
+
+        trees = gbm["model"]["trees"]
+        start, stop = _iteration_range(booster)
+        if stop:
+            trees = trees[: stop * int(gbm["model"]["gbtree_model_param"]["num_parallel_tree"])]
+
+        feat, thresh, left, right, default_left, roots = [], [], [], [], [], []
+        depth, offset = 0, 0
+        for tree in trees:
+            if tree.get("categories_nodes"):
+                raise ValueError("categorical splits are not supported")
+            lc = np.asarray(tree["left_children"], dtype=np.int64)
+            rc = np.asarray(tree["right_children"], dtype=np.int64)
+            leaf = lc == -1
+            nodes = np.arange(len(lc))
+            left.append(np.where(leaf, nodes, lc) + offset)
+            right.append(np.where(leaf, nodes, rc) + offset)
+            feat.append(np.where(leaf, 0, tree["split_indices"]))
+            # Leaf values are stored in split_conditions
+            thresh.append(np.asarray(tree["split_conditions"], dtype=np.float32))
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            roots.append(offset)
+            depth = max(depth, _tree_depth(lc, rc))
+            offset += len(lc)
+
+        self.feat = np.concatenate(feat).astype(np.intp)
+        self.thresh = np.concatenate(thresh)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.default_left = np.concatenate(default_left)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.depth = depth
+        self.base_score = np.float32(_parse_base_score(learner["learner_model_param"]["base_score"]))
+
+    def predict(self, X) -> np.ndarray:
+        X = as_float32(X)
+        n = X.shape[0]
+        node = np.broadcast_to(self.roots, (n, len(self.roots))).copy()
+        rows = np.arange(n)[:, None]
+        for _ in range(self.depth):
+            x = X[rows, self.feat[node]]
+            go_left = np.where(np.isnan(x), self.default_left[node], x < self.thresh[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        leaves = np.empty((n, len(self.roots) + 1), dtype=np.float32)
+        leaves[:, 0] = self.base_score
+        leaves[:, 1:] = self.thresh[node]
+        # cumsum accumulates sequentially, i.e. in tree order
+        return np.cumsum(leaves, axis=1, dtype=np.float32)[:, -1]
+
+
+class CompiledBackend(InferenceBackend):
+    """tl2cgen shared library, compiled once and cached by model content hash."""
+
+    name = "compiled"
+
+    def __init__(self, model, cache_dir: Path, toolchain: str = "gcc"):
+        import tl2cgen
+        import treelite
+
+        booster = model.get_booster()
+        raw = booster.save_raw("json")
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        libpath = cache_dir / f"model-{hashlib.sha256(bytes(raw)).hexdigest()[:16]}.so"
+        if not libpath.exists():
+            t0 = time.perf_counter()
+            tmp = libpath.with_name(libpath.name + ".tmp.so")
+            tl2cgen.export_lib(
+                treelite.frontend.from_xgboost(booster),
+                toolchain=toolchain,
+                libpath=str(tmp),
+                params={"parallel_comp": os.cpu_count() or 1},
+            )
+            tmp.replace(libpath)
+            logger.info(f"Compiled tree ensemble -> {libpath.name} in {time.perf_counter() - t0:.1f}s")
+        self._tl2cgen = tl2cgen
+        self.predictor = tl2cgen.Predictor(str(libpath), nthread=1)
+
+    def predict(self, X) -> np.ndarray:
+        out = self.predictor.predict(self._tl2cgen.DMatrix(as_float32(X)))
+        return np.asarray(out, dtype=np.float32).reshape(-1)
+
+
+class BackendRouter(InferenceBackend):
+    """Dispatch on batch size: routes are (max batch size, backend), ascending."""
+
+    name = "router"
+
+    def __init__(self, routes: Sequence[Tuple[int, InferenceBackend]]):
+        self.routes = list(routes)
+
+    def backend_for(self, n: int) -> InferenceBackend:
+        for limit, backend in self.routes:
+            if n <= limit:
+                return backend
+        return self.routes[-1][1]
+
+    def predict(self, X) -> np.ndarray:
+        return self.backend_for(len(X)).predict(X)
+
+    def describe(self) -> Dict[str, str]:
+        return {str(limit): backend.name for limit, backend in self.routes}
+
+
+def make_backend(name: str, model, cache_dir: Optional[Path] = None) -> InferenceBackend:
+    if name == "booster":
+        return BoosterBackend(model)
+    if name == "numpy":
+        return NumpyTreeBackend(model)
+    if name == "compiled":
+        if cache_dir is None:
+            raise ValueError("compiled backend needs a cache_dir")
+        return CompiledBackend(model, cache_dir)
+    raise ValueError(f"Unknown inference backend: {name}")
+
+
+def probe_matrix(model, n: int, seed: int = 0) -> np.ndarray:
+    """Synthetic rows spanning each feature's split thresholds, with some NaNs."""
+    booster = model.get_booster()
+    df = booster.trees_to_dataframe()
+    splits = df[df["Feature"] != "Leaf"]
+    names = booster.feature_names or [f"f{i}" for i in range(booster.num_features())]
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, len(names))).astype(np.float32)
+    for j, name in enumerate(names):
+        s = splits.loc[splits["Feature"] == name, "Split"]
+        if len(s):
+            lo, hi = float(s.min()), float(s.max())
+            pad = (hi - lo) * 0.1 + 1e-3
+            X[:, j] = rng.uniform(lo - pad, hi + pad, size=n)
+    X[rng.random(X.shape) < 0.02] = np.nan
+    return X
+
+
+def _bench(backend: InferenceBackend, X: np.ndarray, budget: float = 0.05, min_runs: int = 5) -> float:
+    """Median seconds per call."""
+    backend.predict(X)
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_runs or time.perf_counter() - start < budget:
+        t0 = time.perf_counter()
+        backend.predict(X)
+        times.append(time.perf_counter() - t0)
+        if len(times) >= 1000:
+            break
+    return float(np.median(times))
+
+
+def build_backends(
+    model, candidates: Iterable[str] = BACKEND_NAMES, cache_dir: Optional[Path] = None
+) -> List[InferenceBackend]:
+    """
+    Construct the candidate backends without running a prediction, so it is safe
+    before forking (launcher.py): predicting starts XGBoost's OpenMP threads.
+    """
+    backends: List[InferenceBackend] = []
+    for name in candidates:
+        try:
+            backends.append(make_backend(name, model, cache_dir))
+        except Exception as e:
+            logger.info(f"Inference backend '{name}' unavailable: {e}")
+    return backends
+
+
+def select_backend(
+    model,
+    candidates: Iterable[str] = BACKEND_NAMES,
+    batch_sizes: Sequence[int] = BENCH_BATCH_SIZES,
+    cache_dir: Optional[Path] = None,
+    rtol: float = 1e-5,
+    atol: float = 1e-4,
+    built: Optional[Sequence[InferenceBackend]] = None,
+) -> BackendRouter:
+    """
+    Build the candidate backends (or take the `built` ones), drop any that fail or
+    disagree with the booster on probe data, and route every batch size to the
+    fastest remaining one.
+    """
+    reference = BoosterBackend(model)
+    probe = probe_matrix(model, max(batch_sizes))
+    expected = reference.predict(probe)
+
+    backends: List[InferenceBackend] = []
+    for backend in (build_backends(model, candidates, cache_dir) if built is None else built):
+        try:
+            got = backend.predict(probe)
+        except Exception as e:
+            logger.info(f"Inference backend '{backend.name}' unavailable: {e}")
+            continue
+        if not np.allclose(got, expected, rtol=rtol, atol=atol, equal_nan=True):
+            err = float(np.nanmax(np.abs(got - expected)))
+            logger.warning(f"⚠️ Inference backend '{backend.name}' disagrees with the booster (max abs err {err:.3g}), skipped")
+            continue
+        backends.append(backend)
+    if not backends:
+        backends = [reference]
+
+    routes = []
+    for size in sorted(batch_sizes):
+        timings = {b.name: _bench(b, probe[:size]) for b in backends}
+        best = min(backends, key=lambda b: timings[b.name])
+        routes.append((size, best))
+        logger.info(
+            f"Inference batch {size}: "
+            + ", ".join(f"{k} {v * 1e6:.0f}us" for k, v in timings.items())
+            + f" -> {best.name}"
+        )
+    return BackendRouter(routes)
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    depth = np.zeros(len(left), dtype=np.int64)
+    # Children always have larger ids than their parent in XGBoost trees
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max()) if len(depth) else 0
+
+
+def _parse_base_score(value: str) -> float:
+    """base_score is "0.5" in older model files and "[5E-1]" in newer ones."""
+    value = value.strip()
+    if value.startswith("["):
+        value = value.strip("[]").split(",")[0]
+    return float(value)
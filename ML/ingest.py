@@ -0,0 +1,215 @@
+"""
+Streaming ingestion for uploaded files.
+
+Uploads used to be read into memory in one piece and parsed from a BytesIO, so
+peak memory was several times the file size. Here the (already spooled)
+upload is parsed in chunks straight from its file object:
+
+    CSV     pyarrow's streaming, multithreaded CSV reader (falls back to pandas
+            chunked read_csv when pyarrow is missing or the column types change
+            between blocks)
+    NDJSON  one JSON record per line (.ndjson / .jsonl), parsed in row chunks
+    JSON    the existing {"data": [...]} / [...] / {...} document formats
+
+With an InputSchema, every chunk is cast to its column dtypes as it is parsed
+(the Arrow CSV reader converts schema columns from text straight to float32 /
+float64). Byte and row caps are enforced while reading. Every chunk is handed to an
+optional consumer as soon as it is parsed, so callers can start work on early
+chunks while the rest of the file is still being read.
+"""
+
+import io
+import json
+import logging
+from typing import IO, Iterable, Iterator, List, Optional, Protocol
+
+import numpy as np
+import pandas as pd
+
+from input_schema import TEXT_COLS, InputSchema
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pa_csv = None
+
+logger = logging.getLogger("AirQualityServer")
+
+CSV_BLOCK_BYTES = 4 << 20
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeds the configured byte or row cap."""
+
+
+class UploadParseError(ValueError):
+    """The upload could not be parsed."""
+
+
+class ChunkConsumer(Protocol):
+    def reset(self) -> None: ...
+    def add(self, chunk: pd.DataFrame) -> None: ...
+
+
+class _CappedReader(io.RawIOBase):
+    """File wrapper that raises once more than `max_bytes` have been read."""
+
+    def __init__(self, raw: IO[bytes], max_bytes: int):
+        self.raw = raw
+        self.max_bytes = max_bytes
+        self.count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buf) -> int:
+        data = self.raw.read(len(buf))
+        self.count += len(data)
+        if self.max_bytes and self.count > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        buf[: len(data)] = data
+        return len(data)
+
+
+class UploadReader:
+    def __init__(
+        self,
+        max_bytes: int = 0,
+        max_rows: int = 0,
+        chunk_rows: int = 65536,
+        csv_engine: str = "auto",
+        schema: Optional[InputSchema] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.chunk_rows = chunk_rows
+        self.csv_engine = csv_engine
+        self.schema = schema
+
+    def read(self, fileobj: IO[bytes], filename: str, consumer: Optional[ChunkConsumer] = None) -> pd.DataFrame:
+        """Parse the whole upload; chunks are passed to `consumer` as they arrive."""
+        name = (filename or "").lower()
+        if name.endswith(NDJSON_SUFFIXES):
+            return self._collect(self._ndjson_chunks(self._open(fileobj)), consumer)
+        if name.endswith(".json"):
+            return self._collect([self._json_document(self._open(fileobj))], consumer)
+
+        use_arrow = self.csv_engine == "pyarrow" or (self.csv_engine == "auto" and pa_csv is not None)
+        if use_arrow:
+            start = fileobj.tell()
+            try:
+                return self._collect(self._arrow_csv_chunks(self._open(fileobj)), consumer)
+            except UploadTooLarge:
+                raise
+            except Exception as e:
+                logger.info(f"Arrow CSV reader failed ({e}), re-reading with pandas")
+                if consumer is not None:
+                    consumer.reset()
+                fileobj.seek(start)
+        return self._collect(self._pandas_csv_chunks(self._open(fileobj)), consumer)
+
+    def _open(self, fileobj: IO[bytes]) -> io.BufferedReader:
+        return io.BufferedReader(_CappedReader(fileobj, self.max_bytes), buffer_size=1 << 20)
+
+    def _collect(self, chunks: Iterable[pd.DataFrame], consumer: Optional[ChunkConsumer]) -> pd.DataFrame:
+        parts: List[pd.DataFrame] = []
+        invalid = {}
+        rows = 0
+        for chunk in chunks:
+            rows += len(chunk)
+            if self.max_rows and rows > self.max_rows:
+                raise UploadTooLarge(f"Upload exceeds {self.max_rows} rows")
+            if self.schema is not None:
+                chunk, bad = self.schema.cast(chunk)
+                for col, n in bad.items():
+                    invalid[col] = invalid.get(col, 0) + n
+            if "datetime" in chunk.columns:
+                chunk["datetime"] = pd.to_datetime(chunk["datetime"])
+            parts.append(chunk)
+            if consumer is not None:
+                consumer.add(chunk)
+        if invalid:
+            logger.warning(f"⚠️ Unparseable upload values set to NaN: {invalid}")
+        if not parts:
+            return pd.DataFrame()
+        return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+    # --- CSV ---
+
+    def _arrow_csv_chunks(self, f: io.BufferedReader) -> Iterator[pd.DataFrame]:
+        read_options = pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES, use_threads=True)
+        header = f.peek(CSV_BLOCK_BYTES)
+        header = header[: header.rfind(b"\n") + 1] or header
+        # Pin types from the first block: integers widen to float64 (a later block may hold
+        # decimals or blanks), date-like columns stay text as they would with pandas
+        probe = pa_csv.open_csv(io.BytesIO(header), read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES))
+        column_types = {}
+        schema_types = self.schema.dtypes if self.schema is not None else {}
+        for field in probe.schema:
+            if field.name in TEXT_COLS or pa.types.is_temporal(field.type):
+                column_types[field.name] = pa.string()
+            elif field.name in schema_types and not pa.types.is_string(field.type):
+                column_types[field.name] = pa.from_numpy_dtype(schema_types[field.name])
+            elif pa.types.is_integer(field.type) or pa.types.is_null(field.type):
+                column_types[field.name] = pa.float64()
+        convert_options = pa_csv.ConvertOptions(column_types=column_types)
+        reader = pa_csv.open_csv(f, read_options=read_options, convert_options=convert_options)
+        for batch in reader:
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+    def _pandas_csv_chunks(self, f: io.BufferedReader) -> Iterator[pd.DataFrame]:
+        try:
+            reader = pd.read_csv(f, chunksize=self.chunk_rows)
+            for chunk in reader:
+                yield chunk
+        except UploadTooLarge:
+            raise
+        except Exception as e:
+            raise UploadParseError(f"Invalid CSV file: {e}")
+
+    # --- JSON ---
+
+    def _ndjson_chunks(self, f: io.BufferedReader) -> Iterator[pd.DataFrame]:
+        records = []
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                raise UploadParseError(f"Invalid NDJSON line {lineno}: {e}")
+            if len(records) >= self.chunk_rows:
+                yield _typed_frame(records)
+                records = []
+        if records:
+            yield _typed_frame(records)
+
+    def _json_document(self, f: io.BufferedReader) -> pd.DataFrame:
+        try:
+            json_content = json.load(f)
+            if isinstance(json_content, dict) and "data" in json_content:
+                return pd.DataFrame(json_content["data"])
+            elif isinstance(json_content, list):
+                return pd.DataFrame(json_content)
+            return pd.DataFrame([json_content])
+        except UploadTooLarge:
+            raise
+        except Exception as e:
+            raise UploadParseError(f"Invalid JSON file: {e}")
+
+
+def _typed_frame(records: List[dict]) -> pd.DataFrame:
+    """Records -> frame with numeric columns as float64 (text columns untouched)."""
+    df = pd.DataFrame.from_records(records)
+    for col in df.columns:
+        if col in TEXT_COLS or df[col].dtype.kind in "fiub":
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        if values.notna().sum() == df[col].notna().sum():
+            df[col] = values.astype(np.float64)
+    return df
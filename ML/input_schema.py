@@ -0,0 +1,83 @@
+"""
+Typed input schema for forecast requests.
+
+Request rows arrive as whatever pandas infers from JSON records or CSV text, and
+prepare_features used to run pd.to_numeric over every column on every call. The
+schema here is compiled once from the site CSV header plus the model's
+FEATURE_COLS, and ingestion casts each column a single time to an explicit dtype:
+
+    float32   columns that only feed the boosters (forecasts, satellite, ERA5, ...).
+              The boosters evaluate in float32, so nothing is lost.
+    float64   targets, calendar fields and the engineered features (lags, rolling
+              means, spatial and cyclic terms), which later arithmetic runs on
+
+Columns outside the schema are coerced to numbers as before, text columns are left
+alone. Values that fail to parse become NaN and are counted per column in one pass.
+Columnar bodies (keep_wide=True) keep float columns wider than their schema dtype as
+they arrived, so zero-copy float64 arrays are not copied into float32 here; the
+backend casts the feature matrix to float32 once.
+"""
+
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Header of the per-site CSV files (site_{id}_{train_data,unseen_input_data}.csv)
+SITE_CSV_COLUMNS = [
+    "year", "month", "day", "hour",
+    "O3_forecast", "NO2_forecast", "T_forecast", "q_forecast", "u_forecast", "v_forecast", "w_forecast",
+    "blh_forecast", "NO2_satellite", "HCHO_satellite", "ratio_satellite",
+    "O3_target", "NO2_target",
+]
+# Never coerced to numbers, in any body format (JSON, columnar, uploads); uploads read them as text
+TEXT_COLS = ["site", "datetime", "date", "timestamp", "time", "name", "id"]
+# Columns derived features are computed from, kept in float64
+WIDE_COLS = ["year", "month", "day", "hour", "O3_target", "NO2_target", "lat", "lon"]
+ENGINEERED_MARKERS = ("_lag_", "_roll", "_lag1", "_sin", "_cos")
+NUMERIC_KINDS = "fiub"
+
+
+def is_engineered(col: str) -> bool:
+    return any(marker in col for marker in ENGINEERED_MARKERS)
+
+
+class InputSchema:
+    def __init__(self, dtypes: Dict[str, np.dtype]):
+        self.dtypes = dtypes
+
+    @classmethod
+    def compile(cls, raw_columns: Iterable[str], feature_cols: Iterable[str]) -> "InputSchema":
+        dtypes = {}
+        for col in list(raw_columns) + list(feature_cols):
+            if col in TEXT_COLS or col in dtypes:
+                continue
+            wide = col in WIDE_COLS or is_engineered(col)
+            dtypes[col] = np.dtype(np.float64 if wide else np.float32)
+        return cls(dtypes)
+
+    def cast(self, df: pd.DataFrame, keep_wide: bool = False) -> Tuple[pd.DataFrame, Dict[str, int]]:
+        """
+        Frame with every non-text column numeric (schema columns at their dtype), plus
+        the number of values per column that could not be parsed. With keep_wide, float
+        columns already wider than their schema dtype are passed through uncopied.
+        """
+        columns = {}
+        invalid = {}
+        for col in df.columns:
+            values = df[col]
+            if col in TEXT_COLS:
+                columns[col] = values
+                continue
+            if values.dtype.kind not in NUMERIC_KINDS:
+                parsed = pd.to_numeric(values, errors="coerce")
+                bad = int(parsed.isna().sum() - values.isna().sum())
+                if bad:
+                    invalid[col] = bad
+                values = parsed
+            dtype = self.dtypes.get(col)
+            if dtype is not None and values.dtype != dtype:
+                if not (keep_wide and values.dtype.kind == "f" and values.dtype.itemsize > dtype.itemsize):
+                    values = values.astype(dtype)
+            columns[col] = values
+        return pd.DataFrame(columns, index=df.index, copy=False), invalid
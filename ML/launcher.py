@@ -0,0 +1,361 @@
+"""
+Production launcher: preload once, fork N uvicorn workers that share it copy-on-write.
+
+    python launcher.py --workers 4 --port 8000
+
+The master process loads everything the server needs before any worker exists:
+the startup snapshot (ERA5 index, site store, site dates), both boosters and their
+candidate inference backends. The master never predicts: a prediction starts
+XGBoost's OpenMP thread pool, and forking after that is not safe (see
+worker_pool.py). Each worker checks and times the backends and warms up the
+boosters in its own lifespan, after the fork.
+
+After loading, the master runs gc.collect() and gc.freeze(), so the collector of
+a worker never writes to the preloaded objects. Finally it binds the listening
+socket and forks the workers. Each worker runs uvicorn on the shared
+socket, and its lifespan sees the state already loaded and skips loading it
+again. The NumPy / pandas blocks and the boosters' memory are therefore mapped
+once and shared by every worker, until a worker writes to a page.
+
+The master then only supervises:
+
+    --max-requests N     a worker exits gracefully after ~N requests (plus up to
+                         --max-requests-jitter, so workers don't all restart together)
+    --max-worker-age S   recycle a worker after S seconds
+    --max-worker-mb M    recycle a worker whose private memory (pages it no longer
+                         shares with the master) exceeds M MiB
+    SIGHUP               rolling restart: each worker is replaced by a fresh fork
+    SIGUSR1              log the memory report now (it is also logged every
+                         --report-interval seconds)
+    SIGTERM / SIGINT     graceful shutdown (in-flight requests finish within
+                         --graceful-timeout)
+
+Recycling forks the replacement first and then sends SIGTERM to the old worker,
+so capacity never drops during a rolling restart. Replacements are forked from
+the master's state, so they start sharing memory again. Code is not reloaded; to
+deploy new code, restart the master.
+
+State built at request time is per worker and is not shared: the forecast cache
+(each worker warms and fills its own), the micro-batcher (only requests on the same
+worker are batched together), the in-memory spans of /debug/traces/ and the
+profiler. Because arm and result calls would land on different workers,
+/admin/profile/ answers 409 when more than one worker is running. Profile with
+--workers 1.
+
+The memory report comes from /proc/<pid>/smaps_rollup. For each worker it shows
+RSS, PSS (its fair share of shared pages), shared memory and private memory.
+The sum of PSS over master and workers is what the whole server really uses.
+
+Prometheus samples are aggregated across workers: PROMETHEUS_MULTIPROC_DIR is
+pointed at a fresh directory unless it is already set. Worker count defaults to
+WEB_CONCURRENCY or the number of CPUs. Each worker's boosters get
+cpus / workers threads, unless --booster-threads says otherwise.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger("AirQualityServer")
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+MB = 1024 * 1024
+
+
+def memory_usage(pid: int) -> Dict[str, int]:
+    """Bytes of rss / pss / shared / private / swap for a process (empty if unavailable)."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if key in SMAPS_FIELDS and len(parts) == 2 and parts[1] == "kB":
+                    fields[key] = int(parts[0]) * 1024
+    except OSError:
+        return {}
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "swap": fields.get("Swap", 0),
+    }
+
+
+class Worker:
+    def __init__(self, pid: int, slot: int):
+        self.pid = pid
+        self.slot = slot
+        self.started = time.monotonic()
+        self.max_age: Optional[float] = None
+        self.retiring = False
+
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        self.workers: Dict[int, Worker] = {}
+        self.sock: Optional[socket.socket] = None
+        self.server = None
+        self.stopping = False
+        self.reload_requested = False
+        self.report_requested = False
+        self.multiproc_dir: Optional[str] = None
+
+    # --- Master setup ---
+
+    def preload(self):
+        if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            # Must be set before prometheus_client is imported (by server -> metrics)
+            self.multiproc_dir = tempfile.mkdtemp(prefix="sih-ml-prometheus-")
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = self.multiproc_dir
+        else:
+            for name in os.listdir(os.environ["PROMETHEUS_MULTIPROC_DIR"]):
+                if name.endswith(".db"):
+                    os.remove(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], name))
+
+        import server
+
+        server.worker_processes = self.args.workers
+        start = time.perf_counter()
+        server.load_startup_state()
+        # select=False: no predictions (OpenMP threads) in the master, workers benchmark after fork
+        server.load_models(n_jobs=self.args.booster_threads, select=False)
+        if not server.models:
+            logger.warning("⚠️ No models loaded in the master; workers will serve without them")
+        gc.collect()
+        gc.freeze()
+        self.server = server
+        logger.info(f"✅ Preloaded in {time.perf_counter() - start:.1f}s; "
+                    f"master memory: {self.describe(memory_usage(os.getpid()))}")
+
+    def bind(self):
+        family = socket.AF_INET6 if ":" in self.args.host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.args.host, self.args.port))
+        self.sock.listen(self.args.backlog)
+        self.sock.set_inheritable(True)
+        logger.info(f"Listening on {self.args.host}:{self.args.port} with {self.args.workers} workers")
+
+    # --- Workers ---
+
+    def spawn(self, slot: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker()
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        worker = Worker(pid, slot)
+        if self.args.max_worker_age:
+            worker.max_age = self.args.max_worker_age * random.uniform(1.0, 1.1)
+        self.workers[pid] = worker
+        logger.info(f"✅ Worker {slot} started (pid {pid})")
+        return pid
+
+    def run_worker(self):
+        import uvicorn
+
+        for sig in (signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        random.seed()
+        max_requests = None
+        if self.args.max_requests:
+            max_requests = self.args.max_requests + random.randint(0, self.args.max_requests_jitter)
+        config = uvicorn.Config(
+            self.server.app,
+            log_level=self.args.log_level,
+            access_log=self.args.access_log,
+            limit_max_requests=max_requests,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            timeout_keep_alive=self.args.keep_alive,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def retire(self, worker: Worker, reason: str):
+        """Fork the replacement first, then let the old worker finish its requests and exit."""
+        if worker.retiring:
+            return
+        worker.retiring = True
+        logger.info(f"Recycling worker {worker.slot} (pid {worker.pid}): {reason}")
+        self.spawn(worker.slot)
+        self.signal(worker.pid, signal.SIGTERM)
+
+    def signal(self, pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            self.mark_dead(pid)
+            code = os.waitstatus_to_exitcode(status)
+            lifetime = time.monotonic() - worker.started
+            if worker.retiring or self.stopping:
+                logger.info(f"Worker {worker.slot} (pid {pid}) exited")
+                continue
+            if code != 0:
+                logger.warning(f"⚠️ Worker {worker.slot} (pid {pid}) died with code {code} after {lifetime:.0f}s")
+                if lifetime < 5:
+                    time.sleep(1)  # don't fork-loop on a worker that can't start
+            else:
+                logger.info(f"Worker {worker.slot} (pid {pid}) exited after its request limit")
+            self.spawn(worker.slot)
+
+    def mark_dead(self, pid: int):
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            try:
+                from prometheus_client import multiprocess
+                multiprocess.mark_process_dead(pid)
+            except ImportError:
+                pass
+
+    def check_limits(self):
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.retiring:
+                continue
+            if worker.max_age and now - worker.started > worker.max_age:
+                self.retire(worker, f"older than {self.args.max_worker_age:g}s")
+            elif self.args.max_worker_mb:
+                private = memory_usage(worker.pid).get("private", 0)
+                if private > self.args.max_worker_mb * MB:
+                    self.retire(worker, f"private memory {private / MB:.0f} MiB > {self.args.max_worker_mb:g} MiB")
+
+    # --- Memory report ---
+
+    @staticmethod
+    def describe(mem: Dict[str, int]) -> str:
+        if not mem:
+            return "n/a"
+        return ", ".join(f"{k} {v / MB:.0f} MiB" for k, v in mem.items() if k != "swap" or v)
+
+    def memory_report(self):
+        rows = [("master", os.getpid(), memory_usage(os.getpid()))]
+        rows += [(f"worker {w.slot}", w.pid, memory_usage(w.pid))
+                 for w in sorted(self.workers.values(), key=lambda w: w.slot)]
+        lines = [f"{'process':10} {'pid':>7} {'rss':>8} {'pss':>8} {'shared':>8} {'private':>8}   (MiB)"]
+        total_pss = total_rss = 0
+        for name, pid, mem in rows:
+            if not mem:
+                continue
+            total_pss += mem["pss"]
+            total_rss += mem["rss"]
+            lines.append(f"{name:10} {pid:>7} {mem['rss'] / MB:>8.0f} {mem['pss'] / MB:>8.0f} "
+                         f"{mem['shared'] / MB:>8.0f} {mem['private'] / MB:>8.0f}")
+        lines.append(f"total: pss {total_pss / MB:.0f} MiB (sum of rss would suggest {total_rss / MB:.0f} MiB)")
+        logger.info("Memory report\n" + "\n".join(lines))
+
+    # --- Main loop ---
+
+    def install_signals(self):
+        def stop(signum, frame):
+            self.stopping = True
+
+        def reload(signum, frame):
+            self.reload_requested = True
+
+        def report(signum, frame):
+            self.report_requested = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, reload)
+        signal.signal(signal.SIGUSR1, report)
+
+    def run(self):
+        self.preload()
+        self.bind()
+        self.install_signals()
+        for slot in range(self.args.workers):
+            self.spawn(slot)
+
+        next_report = time.monotonic() + self.args.report_interval
+        while not self.stopping:
+            time.sleep(0.5)
+            self.reap()
+            if self.stopping:
+                break
+            if self.reload_requested:
+                self.reload_requested = False
+                for worker in list(self.workers.values()):
+                    self.retire(worker, "SIGHUP")
+            self.check_limits()
+            if self.report_requested or (self.args.report_interval and time.monotonic() >= next_report):
+                self.report_requested = False
+                next_report = time.monotonic() + self.args.report_interval
+                self.memory_report()
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info("Shutting down workers...")
+        for pid in list(self.workers):
+            self.signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning(f"⚠️ Worker pid {pid} did not stop in time, killing it")
+            self.signal(pid, signal.SIGKILL)
+        while self.workers:
+            self.reap()
+            time.sleep(0.1)
+        self.sock.close()
+        if self.multiproc_dir:
+            shutil.rmtree(self.multiproc_dir, ignore_errors=True)
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", cpus)))
+    parser.add_argument("--booster-threads", type=int, help="Booster threads per worker (default cpus / workers)")
+    parser.add_argument("--max-requests", type=int, default=0, help="Recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=0)
+    parser.add_argument("--max-worker-age", type=float, default=0, help="Recycle a worker after this many seconds (0 = never)")
+    parser.add_argument("--max-worker-mb", type=float, default=0, help="Recycle a worker above this private memory (0 = never)")
+    parser.add_argument("--graceful-timeout", type=float, default=30)
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--report-interval", type=float, default=300, help="Seconds between memory reports (0 = only on SIGUSR1)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args()
+    if args.booster_threads is None:
+        args.booster_threads = max(1, cpus // max(args.workers, 1))
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    Master(args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Prometheus metrics for the forecast server.
+
+Every pipeline stage (upload parsing, prepare_features, ERA5 join, recursive
+loop, per-target predict, response formatting) is timed into one histogram,
+labelled with the stage, the endpoint and site of the request it runs for, and
+a row-count bucket. Endpoint and site travel in a context variable set by
+MetricsMiddleware (and by the pipeline once the site is known). Contexts are
+copied into threadpool calls, so stages running in worker threads keep the
+labels of their request. Work outside a request, such as micro-batched predicts
+shared by several requests or the cache warm-up, is labelled endpoint="".
+
+prometheus_client is optional: without it every helper here is a no-op and
+/metrics answers 503. With PROMETHEUS_MULTIPROC_DIR set (several server
+processes), samples are aggregated across processes.
+"""
+
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import tracing
+
+try:
+    import prometheus_client as prom
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover - optional dependency
+    prom = None
+    multiprocess = None
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = [(1, "1"), (24, "2-24"), (168, "25-168"), (1000, "169-1k"), (10000, "1k-10k")]
+ROW_BUCKET_MAX = ">10k"
+
+# Site label values: the registered sites (see register_sites) and "all"; any other id is "other"
+site_labels: Set[str] = {"all"}
+
+# {"endpoint": ..., "site": ...} of the request being served
+request_labels: ContextVar[Dict[str, str]] = ContextVar("request_labels", default={"endpoint": "", "site": ""})
+
+
+def rows_bucket(rows: Optional[int]) -> str:
+    if rows is None:
+        return ""
+    for limit, name in ROW_BUCKETS:
+        if rows <= limit:
+            return name
+    return ROW_BUCKET_MAX
+
+
+if prom is not None:
+    STAGE_SECONDS = prom.Histogram(
+        "aq_stage_seconds", "Latency of forecast pipeline stages",
+        ["stage", "endpoint", "site", "rows"], buckets=STAGE_BUCKETS,
+    )
+    HTTP_SECONDS = prom.Histogram(
+        "aq_http_request_seconds", "HTTP request latency", ["endpoint", "method", "status"], buckets=STAGE_BUCKETS,
+    )
+    RECURSIVE_STEPS = prom.Counter("aq_recursive_steps", "Rows forecast recursively", ["endpoint", "site"])
+    CACHE_LOOKUPS = prom.Counter("aq_forecast_cache_lookups", "Forecast cache lookups", ["result"])
+    THREADPOOL_BUSY = prom.Gauge("aq_threadpool_busy", "Threadpool workers in use", multiprocess_mode="livesum")
+    THREADPOOL_WAITING = prom.Gauge("aq_threadpool_queue_depth", "Calls waiting for a threadpool worker", multiprocess_mode="livesum")
+
+
+def register_sites(sites: Iterable[str]):
+    site_labels.update(sites)
+
+
+def set_site(site: str):
+    """Record the site of the current request (for stages timed after this point)."""
+    labels = request_labels.get()
+    if labels.get("endpoint"):
+        # Site ids come from the request: unknown ones share one label, like unknown paths
+        labels["site"] = site if site in site_labels else "other"
+
+
+class Stage:
+    __slots__ = ("rows",)
+
+    def __init__(self, rows: Optional[int]):
+        self.rows = rows
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None):
+    """
+    Time a block into aq_stage_seconds, the request's Server-Timing header and a
+    span (see tracing.py); `rows` may be set on the yielded object.
+    """
+    st = Stage(rows)
+    start = time.perf_counter()
+    with tracing.span(name) as span:
+        try:
+            yield st
+        finally:
+            elapsed = time.perf_counter() - start
+            tracing.record(name, elapsed)
+            if span is not None and st.rows is not None:
+                span.set_attribute("rows", st.rows)
+            if prom is not None:
+                labels = request_labels.get()
+                STAGE_SECONDS.labels(name, labels["endpoint"], labels["site"], rows_bucket(st.rows)).observe(elapsed)
+
+
+def timed(name: str):
+    """Decorator form of stage(); the row count is len() of the first argument."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name, len(args[0]) if args and hasattr(args[0], "__len__") else None):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def count_recursive_steps(n: int):
+    if prom is not None and n:
+        labels = request_labels.get()
+        RECURSIVE_STEPS.labels(labels["endpoint"], labels["site"]).inc(n)
+
+
+def count_cache_lookup(hit: bool):
+    if prom is not None:
+        CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+
+
+def set_threadpool(busy: float, waiting: float):
+    if prom is not None:
+        THREADPOOL_BUSY.set(busy)
+        THREADPOOL_WAITING.set(waiting)
+
+
+def render() -> Tuple[bytes, str]:
+    """Exposition body and content type for /metrics."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prom.REGISTRY
+    return prom.generate_latest(registry), prom.CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware: sets the request labels and times every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+        self.endpoints: Optional[Set[str]] = None
+
+    def endpoint_for(self, scope) -> str:
+        if self.endpoints is None:
+            self.endpoints = {getattr(route, "path", "") for route in scope["app"].routes}
+        # Unknown paths share one label so scanners can't blow up the series count
+        return scope["path"] if scope["path"] in self.endpoints else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or prom is None:
+            return await self.app(scope, receive, send)
+        endpoint = self.endpoint_for(scope)
+        token = request_labels.set({"endpoint": endpoint, "site": ""})
+        if scope["type"] == "websocket":
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                request_labels.reset(token)
+
+        status = {"code": 500}
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            HTTP_SECONDS.labels(endpoint, scope["method"], str(status["code"])).observe(time.perf_counter() - start)
+            request_labels.reset(token)
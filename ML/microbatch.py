@@ -0,0 +1,124 @@
+"""
+Cross-request micro-batching for model inference.
+
+Concurrent requests (each running its recursive loop in a worker thread) make
+many tiny predict calls. The batcher collects their feature rows on the event
+loop for up to `window_ms` or until `max_rows` rows are queued, runs one
+predict over the stacked matrix and hands every caller its slice back.
+
+Worker threads reach it through predict_threadsafe(), which schedules onto the
+loop with run_coroutine_threadsafe and blocks until the slice arrives.
+"""
+
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+PredictFn = Callable[[np.ndarray], Dict[str, np.ndarray]]
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn: PredictFn, max_rows: int = 256, window_ms: float = 2.0):
+        self.predict_fn = predict_fn
+        self.max_rows = max_rows
+        self.window = window_ms / 1000.0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self._loop_thread: Optional[int] = None
+        # Stats
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.max_batch_rows = 0
+        self.histogram: Dict[int, int] = {}  # batch rows rounded up to a power of two -> count
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.queue = asyncio.Queue()
+        self.task = self.loop.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+        while self.queue is not None and not self.queue.empty():
+            _, fut = self.queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Micro-batcher stopped"))
+
+    async def predict(self, X: np.ndarray) -> Dict[str, np.ndarray]:
+        fut = self.loop.create_future()
+        self.queue.put_nowait((X, fut))
+        return await fut
+
+    def predict_threadsafe(self, X: np.ndarray) -> Dict[str, np.ndarray]:
+        """Blocking predict for worker threads; runs directly when batching can't help."""
+        if not self.running or threading.get_ident() == self._loop_thread or len(X) >= self.max_rows:
+            return self.predict_fn(X)
+        return asyncio.run_coroutine_threadsafe(self.predict(X), self.loop).result()
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            rows = len(batch[0][0])
+            deadline = self.loop.time() + self.window
+            while rows < self.max_rows:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                rows += len(item[0])
+            await self._flush(batch, rows)
+
+    async def _flush(self, batch: List[Tuple[np.ndarray, asyncio.Future]], rows: int):
+        X = batch[0][0] if len(batch) == 1 else np.concatenate([x for x, _ in batch])
+        try:
+            preds = await self.loop.run_in_executor(None, self.predict_fn, X)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        self.requests += len(batch)
+        self.rows += rows
+        self.batches += 1
+        self.max_batch_rows = max(self.max_batch_rows, rows)
+        bucket = 1 << (rows - 1).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+        start = 0
+        for x, fut in batch:
+            stop = start + len(x)
+            if not fut.done():
+                fut.set_result({t: v[start:stop] for t, v in preds.items()})
+            start = stop
+
+    def stats(self) -> Dict:
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_rows": self.max_rows,
+            "batches": self.batches,
+            "requests": self.requests,
+            "rows": self.rows,
+            "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "mean_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+            "max_batch_rows": self.max_batch_rows,
+            "batch_rows_histogram": {str(k): v for k, v in sorted(self.histogram.items())},
+        }
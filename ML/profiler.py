@@ -0,0 +1,256 @@
+"""
+On-demand sampling profiler for the live server (admin only).
+
+An admin arms a session for the next N requests to one endpoint and/or T seconds.
+While a matching request is in flight, a background thread samples the stacks of
+every thread with sys._current_frames() every `interval` seconds, so nothing has
+to be attached to the process. Threads parked in the event loop's selector or in
+an idle threadpool queue are skipped. What remains is where requests spend their
+time: prepare_features copies, the recursive loop, XGBoost predict, formatting.
+Samples are taken process-wide, so requests to other endpoints that overlap a
+profiled one show up too (under their own thread).
+
+With tracemalloc on, memory allocation is traced for the session. The lines that
+grew allocated memory the most are listed, together with the traced peak.
+
+Results come in three forms:
+
+    collapsed    `frame;frame;frame count` lines (flamegraph.pl, inferno, speedscope)
+    speedscope   a speedscope.app JSON file
+    summary      hottest functions by self / inclusive samples, plus the
+                 allocation top-list
+
+Only the process that serves the arm request is profiled. Under launcher.py with
+more than one worker, the endpoints refuse (409): the arm, result and stop calls
+would each reach an arbitrary worker.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_SECONDS = 600
+# Leaf frames of threads that are waiting rather than working
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+FrameKey = Tuple[str, str, int]  # (qualified name, file, first line)
+
+
+class ProfilerBusy(Exception):
+    """A profiling session is already running."""
+
+
+def frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+def frame_name(key: FrameKey) -> str:
+    name, filename, line = key
+    return f"{name} ({os.path.basename(filename)}:{line})" if filename else name
+
+
+class ProfileSession:
+    def __init__(
+        self,
+        endpoint: Optional[str] = None,
+        max_requests: int = 0,
+        seconds: float = 60.0,
+        interval: float = 0.005,
+        trace_memory: bool = True,
+        memory_top: int = 25,
+    ):
+        self.endpoint = endpoint  # None = every endpoint except /admin/
+        self.max_requests = max_requests  # 0 = until `seconds` run out
+        self.seconds = seconds
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.memory_top = memory_top
+
+        self.stacks: Counter = Counter()  # root-first tuple of FrameKeys -> samples
+        self.samples = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.memory: Optional[Dict[str, Any]] = None
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._owns_tracemalloc = False
+
+    def matches(self, path: str) -> bool:
+        if self.endpoint is None:
+            return not path.startswith("/admin/")
+        return path == self.endpoint
+
+    def start(self):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._baseline = tracemalloc.take_snapshot()
+        threading.Thread(target=self._run, name="profiler", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def exit(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            if self.max_requests and self.requests >= self.max_requests:
+                self._stop.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                if self.in_flight:
+                    self._sample(own)
+                self._stop.wait(self.interval)
+        finally:
+            self._finish()
+
+    def _sample(self, own: int):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_key(frame))
+                frame = frame.f_back
+            stack.append((f"[{names.get(ident, ident)}]", "", 0))
+            self.stacks[tuple(reversed(stack))] += 1
+        self.samples += 1
+
+    def _finish(self):
+        if self._baseline is not None:
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+            peak = tracemalloc.get_traced_memory()[1]
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            top = snapshot.compare_to(self._baseline.filter_traces(ignore), "lineno")[:self.memory_top]
+            self.memory = {
+                "peak_bytes": peak,
+                "top": [
+                    {
+                        "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        "size_diff": stat.size_diff,
+                        "size": stat.size,
+                        "count_diff": stat.count_diff,
+                    }
+                    for stat in top
+                ],
+            }
+            self._baseline = None
+        self.finished = time.time()
+        self.done.set()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "running": not self.done.is_set(),
+            "requests": self.requests,
+            "max_requests": self.max_requests,
+            "seconds": self.seconds,
+            "elapsed": (self.finished or time.time()) - self.started,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "tracemalloc": self.trace_memory,
+        }
+
+    def collapsed(self) -> str:
+        return "\n".join(
+            ";".join(frame_name(key) for key in stack) + f" {count}"
+            for stack, count in self.stacks.most_common()
+        ) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        frames: Dict[FrameKey, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.most_common():
+            samples.append([frames.setdefault(key, len(frames)) for key in stack])
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"sih-ml {self.endpoint or 'all endpoints'}",
+            "exporter": "sih-ml profiler",
+            "shared": {
+                "frames": [
+                    {"name": name, "file": filename, "line": line} if filename else {"name": name}
+                    for name, filename, line in frames
+                ]
+            },
+            "profiles": [{
+                "type": "sampled",
+                "name": self.endpoint or "all endpoints",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def summary(self, top: int = 30) -> Dict[str, Any]:
+        """Hottest functions: self = samples with the function on top, total = anywhere on the stack."""
+        own, inclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for key in set(stack[1:]):
+                inclusive[key] += count
+        n = sum(self.stacks.values()) or 1
+
+        def table(counter: Counter) -> List[Dict[str, Any]]:
+            return [
+                {"function": frame_name(key), "samples": count, "percent": round(100 * count / n, 2)}
+                for key, count in counter.most_common(top)
+            ]
+
+        return {**self.status(), "self": table(own), "total": table(inclusive), "memory": self.memory}
+
+
+current: Optional[ProfileSession] = None
+_arm_lock = threading.Lock()
+
+
+def arm(**kwargs) -> ProfileSession:
+    """Start a new session (the previous result is dropped); ProfilerBusy if one is running."""
+    global current
+    with _arm_lock:
+        if current is not None and not current.done.is_set():
+            raise ProfilerBusy("A profiling session is already running")
+        current = ProfileSession(**kwargs)
+        current.start()
+        return current
+
+
+class ProfilerMiddleware:
+    """ASGI middleware: tells the armed session when a matching request starts and ends."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        session = current
+        if scope["type"] != "http" or session is None or session.done.is_set() or not session.matches(scope["path"]):
+            return await self.app(scope, receive, send)
+        session.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.exit()
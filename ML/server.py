@@ -1,26 +1,51 @@
-# RUN USING python -m uvicorn server:app --reload
+# RUN USING python -m uvicorn server:app --reload  (production: python launcher.py, see launcher.py)
+
+import time
+_import_started = time.perf_counter()
 
 import warnings
-import io
+import os
+import re
+import secrets
 import json
+import asyncio
 import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Callable, NamedTuple, Optional, Tuple
+from contextlib import asynccontextmanager, contextmanager
 
 import numpy as np
+import orjson
 import pandas as pd
-import xgboost as xgb
-
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException, Body, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException, Body, Query, Request, Depends, Header
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from starlette.websockets import WebSocketState
+from pydantic import BaseModel, Field, ValidationError
 import uvicorn
+import anyio
+_third_party_imported = time.perf_counter()
+
+from site_store import SiteDataStore
+from snapshot import read_snapshot, write_snapshot
+from forecast_engine import STATE_SIZE, TARGETS, FeatureLayout, SiteState, run_recursive, update_spatial
+from spatial import POLLUTANTS, SpatialFeatureEngine, lag1_col
+import worker_pool
+import metrics
+import tracing
+import profiler
+from inference_backends import InferenceBackend, build_backends, make_backend, select_backend
+from microbatch import MicroBatcher
+from forecast_cache import ForecastCache, artifact_hash
+from ingest import UploadParseError, UploadReader, UploadTooLarge
+from era5_index import ERA5Index
+from input_schema import NUMERIC_KINDS, SITE_CSV_COLUMNS, TEXT_COLS, InputSchema
+from columnar import ARROW_STREAM, NPZ, PARQUET, ColumnarDecodeError, decode_body, is_columnar
+from ws_stream import FrameSender, SlowConsumer
+_imports_done = time.perf_counter()
 
 # --- Configuration ---
 warnings.filterwarnings("ignore")
@@ -29,6 +54,35 @@ DATA_DIR = BASE_DIR / 'Data_SIH_2025_with_blh'
 ARTIFACT_DIR = BASE_DIR / "artifacts/FINAL_PRODUCTION_MODELS"
 ERA5_DATA_PATH = DATA_DIR / "era5_station_timeseries.csv"
 SITES_DATA_PATH = DATA_DIR / "lat_lon_sites.txt"
+SNAPSHOT_PATH = Path(os.environ.get("STARTUP_SNAPSHOT_PATH", BASE_DIR / ".cache" / "startup_snapshot.pkl"))
+# Worker processes for recursive forecasts (0 = run them in the threadpool of this process)
+FORECAST_WORKERS = int(os.environ.get("FORECAST_WORKERS", "0"))
+FORECAST_POOL_START_METHOD = os.environ.get("FORECAST_POOL_START_METHOD", "spawn")
+# Inference engine: "auto" benchmarks INFERENCE_CANDIDATES per batch size, or force booster | numpy | compiled
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "auto")
+INFERENCE_CANDIDATES = os.environ.get("INFERENCE_CANDIDATES", "booster,numpy,compiled").split(",")
+COMPILED_MODEL_DIR = BASE_DIR / ".cache" / "compiled_models"
+# Cross-request micro-batching of predict calls (window 0 = off); batches form per worker process
+MICROBATCH_WINDOW_MS = float(os.environ.get("MICROBATCH_WINDOW_MS", "0"))
+MICROBATCH_MAX_ROWS = int(os.environ.get("MICROBATCH_MAX_ROWS", "256"))
+# Rendered /forecast/by-date/ responses (0 MB = off), cached per worker process; warm-up precomputes every predictable date
+FORECAST_CACHE_MB = float(os.environ.get("FORECAST_CACHE_MB", "128"))
+FORECAST_CACHE_TTL = float(os.environ.get("FORECAST_CACHE_TTL", "0"))  # seconds, 0 = no expiry
+FORECAST_CACHE_WARMUP = os.environ.get("FORECAST_CACHE_WARMUP", "0") == "1"
+# File uploads are parsed in chunks; over either cap -> 413 (0 = no cap)
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_ROWS = int(os.environ.get("UPLOAD_MAX_ROWS", "2000000"))
+UPLOAD_CHUNK_ROWS = int(os.environ.get("UPLOAD_CHUNK_ROWS", "65536"))
+UPLOAD_CSV_ENGINE = os.environ.get("UPLOAD_CSV_ENGINE", "auto")  # auto | pyarrow | pandas
+# /ws/session/ frames queued per socket; a client that leaves the queue full this long is dropped
+WS_SEND_QUEUE = int(os.environ.get("WS_SEND_QUEUE", "64"))
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "10"))
+# /admin/ endpoints (profiler) require this value in the X-Admin-Token header; unset = disabled
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Cold start: register site CSVs and parse each one on first use (only when no startup snapshot is valid)
+LAZY_SITE_DATA = os.environ.get("LAZY_SITE_DATA", "0") == "1"
+# Synthetic predict batch sizes run through every booster before /ready/ reports ready
+WARMUP_BATCH_SIZES = [int(n) for n in os.environ.get("WARMUP_BATCH_SIZES", "1,24,168").split(",") if n]
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -36,9 +90,25 @@ logger = logging.getLogger("AirQualityServer")
 
 # Global State
 models = {}
-era5_data = None
+inference: Dict[str, InferenceBackend] = {}  # Fast predict path per target, built from `models`
+inference_candidates: Dict[str, List[InferenceBackend]] = {}  # Built but not benchmarked yet (launcher.py master)
+batcher: Optional[MicroBatcher] = None  # Shares predict calls across concurrent requests
+model_version = ""  # Content hash of the loaded model artifacts
+forecast_cache: Optional[ForecastCache] = None
+era5_index: Optional[ERA5Index] = None  # ERA5 per site as dense hourly blocks
 site_dates_cache = {}  # Cache for site available dates
 sites_cache = []  # Pre-computed sites response for /sites/ endpoint
+site_store: Optional[SiteDataStore] = None  # In-memory site CSVs indexed by (site, date)
+spatial_engine: Optional[SpatialFeatureEngine] = None  # IDW weights between registered sites
+ready = False  # Set once the boosters have been warmed up (see /ready/)
+# Processes serving the same socket (set by launcher.py before forking); the forecast
+# cache, micro-batcher, profiler and in-memory traces are separate in each of them
+worker_processes = 1
+# Seconds per startup step (imports, state, models, warm-up), logged and reported by /ready/
+startup_times: Dict[str, float] = {
+    "import third-party": round(_third_party_imported - _import_started, 3),
+    "import server modules": round(_imports_done - _third_party_imported, 3),
+}
 
 # --- Feature Columns ---
 FEATURE_COLS = [
@@ -57,63 +127,50 @@ FEATURE_COLS = [
     "O3_diff_mean_lag1", "NO2_diff_mean_lag1",
     "era5_blh", "era5_tcc", "era5_t2m", "era5_d2m", "era5_ssrd", "era5_tp"
 ]
+# Request columns are cast to these dtypes once, at ingestion (see input_schema.py)
+INPUT_SCHEMA = InputSchema.compile(SITE_CSV_COLUMNS, FEATURE_COLS)
 
 # --- Helper Logic ---
 
+@contextmanager
+def startup_step(name: str):
+    """Time a startup step into `startup_times` and log it."""
+    start = time.perf_counter()
+    yield
+    startup_times[name] = round(time.perf_counter() - start, 3)
+    logger.info(f"Startup: {name} took {startup_times[name]:.2f}s")
+
 def load_era5_data():
-    global era5_data
+    global era5_index
     if ERA5_DATA_PATH.exists():
         logger.info(f"Loading ERA5 data from {ERA5_DATA_PATH}...")
-        era5_data = pd.read_csv(ERA5_DATA_PATH)
-        era5_data["datetime"] = pd.to_datetime(era5_data["datetime"])
+        era5_index = ERA5Index.from_frame(pd.read_csv(ERA5_DATA_PATH))
+        logger.info(f"✅ ERA5 index ready: {len(era5_index.blocks)} sites, {era5_index.n_hours} hours")
     else:
         logger.warning(f"⚠️ ERA5 data not found at {ERA5_DATA_PATH}.")
 
+def load_site_store():
+    global site_store
+    logger.info(f"Loading site data store from {DATA_DIR}...")
+    site_store = SiteDataStore(DATA_DIR).load(lazy=LAZY_SITE_DATA)
+
 def load_site_dates():
     """
-    Load available dates for each site from train and unseen data files.
+    Load available dates for each site from the site data store (train + unseen files).
     Returns a dict: {site_id: {"available_dates": [...], "predictable_dates": [...]}}
     """
     global site_dates_cache
-    from datetime import timedelta
     
     site_dates = {}
     
-    # Scan for site files (site_1_train_data.csv, site_1_unseen_input_data.csv, etc.)
     for site_id in range(1, 8):  # Sites 1-7
-        all_dates = set()
-        
-        # Check both train and unseen data files
-        for file_type in ["train_data", "unseen_input_data"]:
-            file_path = DATA_DIR / f"site_{site_id}_{file_type}.csv"
-            if file_path.exists():
-                try:
-                    df = pd.read_csv(file_path)
-                    # Create date from year, month, day columns
-                    if all(col in df.columns for col in ["year", "month", "day"]):
-                        df["date"] = pd.to_datetime(
-                            df[["year", "month", "day"]].astype(int).assign(
-                                year=lambda x: x["year"].astype(int),
-                                month=lambda x: x["month"].astype(int),
-                                day=lambda x: x["day"].astype(int)
-                            )
-                        )
-                        unique_dates = df["date"].dt.strftime("%Y-%m-%d").unique()
-                        all_dates.update(unique_dates)
-                except Exception as e:
-                    logger.warning(f"Error loading dates from {file_path}: {e}")
-        
-        # Sort dates
-        available_dates = sorted(list(all_dates))
+        # Day keys (YYYYMMDD) indexed per file by the store (date columns only for unparsed files)
+        day_keys = site_store.day_keys(site_id) if site_store else np.array([], dtype=np.int64)
+        dates = pd.to_datetime(day_keys.astype(str), format="%Y%m%d")
         
-        # Calculate predictable dates (each available date + 1 day)
-        predictable_dates = []
-        for date_str in available_dates:
-            next_date = pd.to_datetime(date_str) + timedelta(days=1)
-            predictable_dates.append(next_date.strftime("%Y-%m-%d"))
-        
-        # Remove duplicates and sort
-        predictable_dates = sorted(list(set(predictable_dates)))
+        # Predictable dates are each available date + 1 day (still unique and sorted)
+        available_dates = dates.strftime("%Y-%m-%d").tolist()
+        predictable_dates = (dates + pd.Timedelta(days=1)).strftime("%Y-%m-%d").tolist()
         
         site_dates[str(site_id)] = {
             "available_dates": available_dates,
@@ -158,22 +215,91 @@ def load_sites_data():
         logger.warning(f"⚠️ Sites data not found at {SITES_DATA_PATH}.")
         return []
 
-def prepare_features(df: pd.DataFrame) -> pd.DataFrame:
+def snapshot_sources() -> List[Path]:
+    """Files the startup snapshot is keyed on."""
+    return sorted(DATA_DIR.glob("site_*_*.csv")) + [SITES_DATA_PATH, ERA5_DATA_PATH]
+
+def load_startup_state():
+    """
+    Restore ERA5, site store, site dates and the /sites/ payload from the binary
+    snapshot if the source files are unchanged, otherwise parse and re-snapshot.
+    """
+    global era5_index, site_store, site_dates_cache, sites_cache
+    
+    sources = snapshot_sources()
+    snap = read_snapshot(SNAPSHOT_PATH, sources)
+    if snap is not None:
+        era5_index = snap["era5_index"]
+        site_store = snap["site_store"]
+        site_dates_cache = snap["site_dates"]
+        sites_cache = snap["sites"]
+        logger.info(f"✅ Startup state restored from snapshot {SNAPSHOT_PATH}")
+        build_spatial_engine()
+        return
+    
+    load_era5_data()
+    load_site_store()
+    load_site_dates()  # Load available dates for all sites
+    
+    # Pre-compute and cache sites data for fast /sites/ responses
+    sites_cache = load_sites_data()
+    
+    if LAZY_SITE_DATA:
+        # A snapshot of a partly parsed store would be incomplete
+        build_spatial_engine()
+        return
+    if write_snapshot(SNAPSHOT_PATH, sources, {
+        "era5_index": era5_index,
+        "site_store": site_store,
+        "site_dates": site_dates_cache,
+        "sites": sites_cache,
+    }):
+        logger.info(f"Startup snapshot written to {SNAPSHOT_PATH}")
+    build_spatial_engine()
+
+def build_spatial_engine():
+    """Precompute the inverse-distance weight matrix for the registered sites."""
+    global spatial_engine
+    spatial_engine = SpatialFeatureEngine.from_sites(sites_cache)
+    if spatial_engine is not None:
+        logger.info(f"✅ Spatial feature engine ready for {len(spatial_engine.site_ids)} sites")
+
+def add_spatial_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    City mean/std, IDW and diff-from-mean of the lag-1 targets across the sites in df, per timestamp.
+    Only sites with rows in df count: a single-site frame gets city mean = IDW = its own lag1
+    and std = diff = 0, unlike training (all sites). /forecast/by-date/ therefore forecasts the
+    requested site together with every other site of that day; free-form bodies (JSON, columnar,
+    uploads) hold one site and get this fallback unless they supply the spatial columns.
+    """
+    lag1 = {p: df[lag1_col(p)].to_numpy(dtype=np.float64) for p in POLLUTANTS if lag1_col(p) in df.columns}
+    feats = spatial_engine.compute_frame(
+        df["datetime"].to_numpy(),
+        pd.to_numeric(df["site"], errors="coerce").to_numpy(dtype=np.float64),
+        lag1,
+    )
+    for col, values in feats.items():
+        df[col] = values
+    return df
+
+@metrics.timed("prepare_features")
+def prepare_features(df: pd.DataFrame, spatial: bool = True) -> pd.DataFrame:
     df = df.copy()
     if "datetime" in df.columns:
         if not pd.api.types.is_datetime64_any_dtype(df["datetime"]):
             df["datetime"] = pd.to_datetime(df["datetime"])
         df = df.sort_values(["site", "datetime"]).reset_index(drop=True)
     
-    # Coerce numeric columns (handle JSON string inputs)
+    # Coerce numeric columns (handle JSON string inputs); frames from typed_input are already numeric
     for col in df.columns:
-        if col not in ["site", "datetime", "date", "timestamp", "name", "id"]:
+        if col not in TEXT_COLS and df[col].dtype.kind not in NUMERIC_KINDS:
             df[col] = pd.to_numeric(df[col], errors='coerce')
     
-    # Merge ERA5
-    if era5_data is not None and "era5_blh" not in df.columns:
+    # Join ERA5 (gather from the hour-indexed blocks, NaN where there is no match)
+    if era5_index is not None and "era5_blh" not in df.columns:
         if "site" in df.columns and "datetime" in df.columns:
-            df = df.merge(era5_data, on=["site", "datetime"], how="left")
+            with metrics.stage("era5_join", len(df)):
+                df = era5_index.join(df)
     
     # Engineer Lags/Rolling
     if "O3_roll24_mean" not in df.columns and "O3_target" in df.columns:
@@ -184,6 +310,11 @@ def prepare_features(df: pd.DataFrame) -> pd.DataFrame:
             df[f"O3_lag_{lag}h"] = df.groupby("site")["O3_target"].shift(lag)
             df[f"NO2_lag_{lag}h"] = df.groupby("site")["NO2_target"].shift(lag)
 
+    # Spatial (cross-site) lag-1 features, same definitions as training
+    if (spatial and spatial_engine is not None and "O3_city_mean_lag1" not in df.columns
+            and "O3_lag_1h" in df.columns and "datetime" in df.columns and "site" in df.columns):
+        df = add_spatial_features(df)
+
     # Time Features
     if "hour" not in df.columns and "datetime" in df.columns:
         df["hour"] = df["datetime"].dt.hour
@@ -197,23 +328,110 @@ def prepare_features(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+def typed_input(df: pd.DataFrame, keep_wide: bool = False) -> pd.DataFrame:
+    """Cast request rows to INPUT_SCHEMA (one pass, unparseable values -> NaN)."""
+    df, invalid = INPUT_SCHEMA.cast(df, keep_wide=keep_wide)
+    if invalid:
+        logger.warning(f"⚠️ Unparseable input values set to NaN: {invalid}")
+    return df
+
+def predict_matrix(X) -> Dict[str, np.ndarray]:
+    """Run every loaded booster on a FEATURE_COLS-ordered matrix (or DataFrame)."""
+    results = {}
+    for target in TARGETS:
+        if target in inference:
+            with metrics.stage(f"predict_{target}", len(X)):
+                results[target] = inference[target].predict(X)
+        elif target in models:
+            with metrics.stage(f"predict_{target}", len(X)):
+                results[target] = models[target].predict(X)
+    return results
+
+def predict_rows(X) -> Dict[str, np.ndarray]:
+    """predict_matrix, via the micro-batcher when it runs (called from worker threads)."""
+    if batcher is not None:
+        return batcher.predict_threadsafe(np.asarray(X, dtype=np.float64))
+    return predict_matrix(X)
+
 def predict_single_step(df: pd.DataFrame) -> Dict[str, List[float]]:
     for col in FEATURE_COLS:
         if col not in df.columns: df[col] = 0.0
             
     X = df[FEATURE_COLS]
-    results = {}
+    return {k: v.tolist() for k, v in predict_rows(X).items()}
+
+FEATURE_LAYOUT = FeatureLayout(FEATURE_COLS)
+
+def run_recursive_forecast(df_prep: pd.DataFrame, update_lags: bool = True, update_spatial_cols: bool = True):
+    """
+    Recursive forecast on a prepared frame (sorted by site, datetime).
+    Every row from a site's first missing O3_target onward is predicted step by step,
+    feeding predictions back into the lag/rolling (and spatial) state; those targets
+    are filled in place on df_prep. History rows are batch predicted.
+    Returns (predictions for every row, bool mask of the recursively forecast rows).
+    """
+    for col in FEATURE_COLS:
+        if col not in df_prep.columns: df_prep[col] = 0.0
     
-    if "O3_target" in models:
-        results["O3_target"] = models["O3_target"].predict(X).tolist()
-    if "NO2_target" in models:
-        results["NO2_target"] = models["NO2_target"].predict(X).tolist()
-        
-    return results
+    # float64 so lag1 feeds the spatial stats exactly as in the batch pass; boosters cast to float32
+    X = df_prep[FEATURE_COLS].to_numpy(dtype=np.float64)
+    sites = df_prep["site"].to_numpy()
+    future = df_prep["O3_target"].isna().groupby(sites).cummax().to_numpy()
+    targets = {t: df_prep[t].to_numpy(dtype=np.float64) for t in TARGETS}
+    
+    spatial = spatial_engine if update_spatial_cols and "datetime" in df_prep.columns else None
+    times = df_prep["datetime"].to_numpy() if spatial is not None else None
+    
+    if update_lags:
+        steps = int(future.sum())
+        with metrics.stage("recursive_loop", steps):
+            step_preds = run_recursive(X, sites, targets, future, FEATURE_LAYOUT,
+                                       tracing.traced_steps(predict_rows), times, spatial)
+        metrics.count_recursive_steps(steps)
+        preds = {t: v for t, v in step_preds.items() if t in models}
+        if (~future).any():
+            if spatial is not None:
+                # History rows see the final (filled) lag1 of their neighbours
+                update_spatial(X, np.flatnonzero(~future), times,
+                               pd.to_numeric(df_prep["site"], errors="coerce").to_numpy(dtype=np.float64),
+                               FEATURE_LAYOUT, spatial)
+            for t, v in predict_rows(X[~future]).items():
+                preds[t][~future] = v
+    else:
+        # Lags were supplied with the input, so predictions never feed back into features
+        preds = {t: v.astype(np.float64) for t, v in predict_rows(X).items()}
+        for t, v in preds.items():
+            targets[t][future] = v[future]
+    
+    for t in preds:
+        df_prep.loc[future, t] = targets[t][future]
+    
+    return {t: v.tolist() for t, v in preds.items()}, future
 
 def sanitize_list(data_list: List[Any]) -> List[Any]:
     return [None if isinstance(x, float) and (np.isnan(x) or np.isinf(x)) else x for x in data_list]
 
+def finite_list(values) -> List[Any]:
+    """sanitize_list for numeric arrays/Series: non-finite values masked in NumPy, then set to None."""
+    arr = np.asarray(values)
+    if arr.dtype.kind != "f":
+        return sanitize_list(arr.tolist() if arr.dtype.kind in "iub" else list(values))
+    out = arr.tolist()
+    for i in np.flatnonzero(~np.isfinite(arr)).tolist():
+        out[i] = None
+    return out
+
+def format_timestamps(series: pd.Series) -> List[str]:
+    """Bulk "%Y-%m-%d %H:%M:%S" strings for a naive datetime column."""
+    values = series.to_numpy()
+    if series.dt.tz is None and not np.isnat(values).any():
+        text = np.datetime_as_string(values.astype("datetime64[s]"), unit="s")
+        if text.dtype.itemsize == 19 * 4:  # "YYYY-MM-DDTHH:MM:SS": swap the "T" in place
+            text.view("U1").reshape(len(text), 19)[:, 10] = " "
+            return text.tolist()
+    return series.dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+
+@metrics.timed("format_response")
 def format_data_response(df, predictions, error_metrics=False):
     response = {
         "dates": [],
@@ -230,7 +448,7 @@ def format_data_response(df, predictions, error_metrics=False):
         try:
             if not pd.api.types.is_datetime64_any_dtype(df[date_col]):
                 df[date_col] = pd.to_datetime(df[date_col])
-            response["dates"] = df[date_col].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+            response["dates"] = format_timestamps(df[date_col])
         except:
             response["dates"] = df[date_col].astype(str).tolist()
     else:
@@ -239,12 +457,13 @@ def format_data_response(df, predictions, error_metrics=False):
     # Actual (Ground Truth)
     for col in ["O3_target", "NO2_target"]:
         if col in df.columns:
-            response["actual"][col] = sanitize_list(df[col].tolist())
-            response["historical"][col] = sanitize_list(df[col].tolist())
+            values = finite_list(df[col])
+            response["actual"][col] = values
+            response["historical"][col] = values
     
     # Predicted & Forecast
     for col, preds in predictions.items():
-        pred_values = sanitize_list(preds)
+        pred_values = finite_list(preds)
         response["predicted"][col] = pred_values
         response["forecast"][col] = pred_values
 
@@ -255,7 +474,7 @@ def format_data_response(df, predictions, error_metrics=False):
             if target_col in df.columns and target_col in predictions:
                 try:
                     actual = np.array(df[target_col].fillna(np.nan))
-                    pred = np.array([np.nan if x is None else x for x in predictions[target_col]])
+                    pred = np.asarray(predictions[target_col], dtype=np.float64)  # None -> NaN
                     
                     mask = ~(np.isnan(actual) | np.isnan(pred))
                     if mask.sum() > 0:
@@ -277,47 +496,114 @@ def format_data_response(df, predictions, error_metrics=False):
 
     return response
 
-async def parse_uploaded_file(file: UploadFile) -> pd.DataFrame:
-    contents = await file.read()
-    filename = file.filename.lower()
+class ChunkedFeatures:
+    """
+    prepare_features over an upload while it is still being parsed.
+    Only for history-only, single-site uploads whose rows are strictly time-ordered
+    (the order the pipeline would sort them into anyway): each chunk is prepared
+    together with the previous chunk's last rows, so lags and rolling means match
+    a single pass over the whole file. Any other upload disables it, and the
+    pipeline prepares features as usual.
+    """
     
-    if filename.endswith(".json"):
-        try:
-            json_content = json.loads(contents)
-            if isinstance(json_content, dict) and "data" in json_content:
-                df = pd.DataFrame(json_content["data"])
-            elif isinstance(json_content, list):
-                df = pd.DataFrame(json_content)
-            else:
-                df = pd.DataFrame([json_content])
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid JSON file: {str(e)}")
-    else:
+    CONTEXT_ROWS = STATE_SIZE
+    
+    def __init__(self, site_id: str):
+        self.site = site_number(site_id)
+        self.reset()
+    
+    def reset(self):
+        self.valid = True
+        self.parts: List[pd.DataFrame] = []
+        self.carry: Optional[pd.DataFrame] = None
+        self.columns = None
+        self.site_value = None
+    
+    def add(self, chunk: pd.DataFrame):
+        if not self.valid:
+            return
+        chunk = chunk.copy()
+        if "site" not in chunk.columns:
+            chunk["site"] = self.site
+        if not self._accepts(chunk):
+            self.valid = False
+            self.parts = []
+            self.carry = None
+            return
+        ctx = chunk if self.carry is None else pd.concat([self.carry, chunk], ignore_index=True)
         try:
-            df = pd.read_csv(io.BytesIO(contents))
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
+            prep = prepare_features(ctx)
+        except Exception:
+            self.valid = False
+            self.parts = []
+            return
+        skip = 0 if self.carry is None else len(self.carry)
+        self.parts.append(prep.iloc[skip:])
+        self.carry = ctx.iloc[-self.CONTEXT_ROWS:]
+    
+    def _accepts(self, chunk: pd.DataFrame) -> bool:
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        elif list(chunk.columns) != self.columns:
+            return False
+        if "O3_target" not in chunk.columns or chunk["O3_target"].isna().any():
+            return False
+        sites = chunk["site"].unique()
+        if len(sites) != 1 or (self.site_value is not None and sites[0] != self.site_value):
+            return False
+        self.site_value = sites[0]
+        if "datetime" in chunk.columns:
+            times = chunk["datetime"] if self.carry is None else pd.concat([self.carry["datetime"].iloc[-1:], chunk["datetime"]])
+            if times.isna().any() or not (np.diff(times.to_numpy()) > np.timedelta64(0)).all():
+                return False
+        return True
+    
+    def result(self) -> Optional[pd.DataFrame]:
+        if not self.valid or not self.parts:
+            return None
+        return pd.concat(self.parts, ignore_index=True)
 
-    if "datetime" in df.columns:
-        df["datetime"] = pd.to_datetime(df["datetime"])
-        
-    return df
+upload_reader = UploadReader(UPLOAD_MAX_BYTES, UPLOAD_MAX_ROWS, UPLOAD_CHUNK_ROWS, UPLOAD_CSV_ENGINE, INPUT_SCHEMA)
+
+def read_upload(file: UploadFile, site_id: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Parse an upload in chunks. With a site_id, also returns early-prepared features (or None)."""
+    features = ChunkedFeatures(site_id) if site_id is not None else None
+    file.file.seek(0)
+    with metrics.stage("upload_parse") as st:
+        df = upload_reader.read(file.file, file.filename, features)
+        st.rows = len(df)
+    return df, features.result() if features is not None else None
+
+async def parse_uploaded_file(file: UploadFile, site_id: Optional[str] = None) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    Returns (rows, prepared features or None). Parsing (and the early feature pass)
+    runs in the threadpool, straight from the spooled upload.
+    """
+    if site_id is not None:
+        metrics.set_site(f"{site_number(site_id):g}")
+    if UPLOAD_MAX_BYTES and file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {UPLOAD_MAX_BYTES} bytes")
+    try:
+        return await run_in_threadpool(read_upload, file, site_id)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadParseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # --- App Lifecycle ---
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global sites_cache
-    
-    load_era5_data()
-    load_site_dates()  # Load available dates for all sites
-    
-    # Pre-compute and cache sites data for fast /sites/ responses
-    sites_cache = load_sites_data()
-    logger.info(f"✅ Sites data cached: {len(sites_cache)} sites with predictable dates")
-    
+def load_models(n_jobs: Optional[int] = None, select: bool = True):
+    """
+    Load the production boosters into `models` and their inference backends into `inference`.
+    With select=False nothing is predicted (launcher.py, before forking): INFERENCE_BACKEND=auto
+    candidates are only built, and select_inference_backends() checks and times them later.
+    """
+    global model_version
     o3_path = ARTIFACT_DIR / "production_O3_era5_spatial.json"
     no2_path = ARTIFACT_DIR / "production_NO2_era5_spatial.json"
+    model_version = artifact_hash([o3_path, no2_path])
+    
+    import xgboost as xgb  # Deferred: the import alone takes seconds (it pulls in scikit-learn)
     
     if o3_path.exists():
         models["O3_target"] = xgb.XGBRegressor()
@@ -328,11 +614,103 @@ async def lifespan(app: FastAPI):
         models["NO2_target"] = xgb.XGBRegressor()
         models["NO2_target"].load_model(str(no2_path))
         logger.info("✅ NO2 Model Loaded")
+    
+    for target, model in models.items():
+        if n_jobs is not None:
+            model.set_params(n_jobs=n_jobs)
+        try:
+            if INFERENCE_BACKEND == "auto":
+                inference_candidates[target] = build_backends(model, INFERENCE_CANDIDATES, COMPILED_MODEL_DIR)
+            else:
+                inference[target] = make_backend(INFERENCE_BACKEND, model, COMPILED_MODEL_DIR)
+        except Exception as e:
+            logger.warning(f"⚠️ Inference backend for {target} failed ({e}), using XGBRegressor.predict")
+    if select:
+        select_inference_backends()
+
+def select_inference_backends():
+    """Route each batch size to the fastest candidate backend (runs predictions)."""
+    for target, built in inference_candidates.items():
+        try:
+            inference[target] = select_backend(models[target], built=built)
+        except Exception as e:
+            logger.warning(f"⚠️ Inference backend for {target} failed ({e}), using XGBRegressor.predict")
+    inference_candidates.clear()
+
+def warm_up_models():
+    """
+    Synthetic predictions at WARMUP_BATCH_SIZES through every booster, so one-time
+    costs (OpenMP thread pool, predictor buffers, compiled model pages) are not paid
+    by the first requests. Bypasses predict_matrix to keep them out of the metrics.
+    """
+    X = np.zeros((max(WARMUP_BATCH_SIZES, default=1), len(FEATURE_COLS)), dtype=np.float32)
+    for target in TARGETS:
+        predict = inference[target].predict if target in inference else models[target].predict if target in models else None
+        if predict is None:
+            continue
+        for n in WARMUP_BATCH_SIZES:
+            predict(X[:n])
+
+async def warm_up():
+    global ready
+    with startup_step("warm-up"):
+        await run_in_threadpool(warm_up_models)
+    ready = True
+    logger.info(f"✅ Ready: {time.perf_counter() - _import_started:.2f}s since import "
+                f"({', '.join(f'{k} {v:.2f}s' for k, v in startup_times.items())})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global sites_cache, site_store, batcher, forecast_cache, ready
+    
+    with startup_step("tracing"):
+        logger.info(f"✅ Tracing: spans -> {tracing.setup()}")
+    # State preloaded by launcher.py before forking is shared with the master, not reloaded
+    if site_store is None:
+        with startup_step("startup state"):
+            load_startup_state()
+    logger.info(f"✅ Sites data cached: {len(sites_cache)} sites with predictable dates")
+    metrics.register_sites(f"{site_number(site['id']):g}" for site in sites_cache)
+    
+    if not models:
+        with startup_step("models"):
+            load_models()
+    elif inference_candidates:
+        # Boosters preloaded by launcher.py: backends are benchmarked here, after the fork
+        with startup_step("inference backends"):
+            select_inference_backends()
+    with startup_step("forecast workers"):
+        worker_pool.start(FORECAST_WORKERS, FORECAST_POOL_START_METHOD)
+    
+    if MICROBATCH_WINDOW_MS > 0:
+        batcher = MicroBatcher(predict_matrix, MICROBATCH_MAX_ROWS, MICROBATCH_WINDOW_MS)
+        await batcher.start()
+        logger.info(f"✅ Micro-batching on: {MICROBATCH_WINDOW_MS} ms window, {MICROBATCH_MAX_ROWS} rows max")
+    
+    warmup = None
+    if FORECAST_CACHE_MB > 0:
+        forecast_cache = ForecastCache(int(FORECAST_CACHE_MB * 1024 * 1024), FORECAST_CACHE_TTL)
+        if FORECAST_CACHE_WARMUP:
+            warmup = asyncio.create_task(warm_forecast_cache())
+    models_warmup = asyncio.create_task(warm_up())
         
     yield
+    models_warmup.cancel()
+    ready = False
+    if warmup is not None:
+        warmup.cancel()
+    forecast_cache = None
+    if batcher is not None:
+        await batcher.stop()
+        batcher = None
+    worker_pool.shutdown()
+    inference.clear()
+    inference_candidates.clear()
     models.clear()
     site_dates_cache.clear()
     sites_cache = []
+    site_store = None
+    tracing.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -343,34 +721,127 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(profiler.ProfilerMiddleware)
 
 class JsonInput(BaseModel):
     site_id: str
     data: List[Dict[str, Any]]
 
+class ForecastInput(NamedTuple):
+    site_id: str
+    df: pd.DataFrame
+
+# OpenAPI: the forecast/plot endpoints take JsonInput or a columnar body (see columnar.py)
+FORECAST_BODY_DOC = {
+    "requestBody": {
+        "required": True,
+        "description": (
+            "Rows of one site. Cross-site features (*_city_mean_lag1, *_city_std_lag1, *_idw_lag1, "
+            "*_diff_mean_lag1) can only use the sites in the body, so unless these columns are supplied "
+            "they fall back to the site's own lag1 (std and diff 0). /forecast/by-date/ and "
+            "/forecast/by-date/all/ use every site's stored rows instead."
+        ),
+        "content": {
+            "application/json": {"schema": JsonInput.model_json_schema()},
+            ARROW_STREAM: {"schema": {"type": "string", "format": "binary"}},
+            PARQUET: {"schema": {"type": "string", "format": "binary"}},
+            NPZ: {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+async def forecast_input(
+    request: Request,
+    site_id: Optional[str] = Query(None, description="Site id, required with columnar (Arrow / Parquet / NPZ) bodies"),
+) -> ForecastInput:
+    """JsonInput body, or a columnar table selected by Content-Type with site_id as a query parameter."""
+    content_type = request.headers.get("content-type", "")
+    if is_columnar(content_type):
+        if site_id is None:
+            raise HTTPException(status_code=400, detail="site_id query parameter is required for columnar bodies")
+        length = request.headers.get("content-length")
+        if UPLOAD_MAX_BYTES and length and length.isdigit() and int(length) > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body exceeds {UPLOAD_MAX_BYTES} bytes")
+        body = await request.body()
+        with metrics.stage("parse_input") as st:
+            try:
+                df = typed_input(await run_in_threadpool(decode_body, body, content_type), keep_wide=True)
+            except ColumnarDecodeError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            st.rows = len(df)
+        return ForecastInput(site_id, df)
+    
+    try:
+        body = await request.json()
+    except ValueError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid", "loc": ("body", 0), "msg": "JSON decode error", "input": {}, "ctx": {"error": str(e)}
+        }])
+    with metrics.stage("parse_input") as st:
+        try:
+            payload = JsonInput.model_validate(body)
+        except ValidationError as e:
+            raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+        df = typed_input(pd.DataFrame(payload.data))
+        st.rows = len(df)
+    return ForecastInput(payload.site_id, df)
+
 # ==============================================================================
 # 1. CORE PIPELINE (Auto-Recursive)
 # ==============================================================================
 
-async def run_forecast_pipeline(df: pd.DataFrame, site_id: str, resample: Optional[str] = None) -> Dict[str, List[float]]:
+def site_number(site_id) -> float:
+    """Numeric site feature from ids like "1", "1.0" or "site_1" (0.0 if none)."""
+    num = re.search(r'\d+', str(site_id))
+    return float(num.group()) if num else 0.0
+
+async def run_cpu_bound(fn, *args):
+    """
+    Run a module-level CPU-bound function off the event loop: in the forecast
+    process pool when FORECAST_WORKERS > 0, otherwise in the threadpool.
+    """
+    if worker_pool.enabled():
+        return await worker_pool.submit(fn.__name__, *args)
+    return await run_in_threadpool(fn, *args)
+
+def forecast_recursive(df: pd.DataFrame) -> Tuple[Dict[str, List[float]], Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+    """
+    CPU part of the recursive branch (runs in a worker process or thread).
+    Returns (predictions, {target: (df index labels, filled values)} for the forecast rows).
+    """
+    # prepare_features only engineers lags when they are not supplied with the input
+    update_lags = "O3_roll24_mean" not in df.columns
+    update_spatial_cols = "O3_city_mean_lag1" not in df.columns
+    df_prep = prepare_features(df)
+    preds_dict, future = run_recursive_forecast(df_prep, update_lags, update_spatial_cols)
+    
+    # df_prep rows are in (site, datetime) order
+    if "datetime" in df.columns:
+        order = df[["site"]].assign(datetime=pd.to_datetime(df["datetime"])).sort_values(["site", "datetime"]).index
+    else:
+        order = df.index
+    filled = {t: (order[future].to_numpy(), df_prep.loc[future, t].to_numpy()) for t in preds_dict}
+    return preds_dict, filled
+
+async def run_forecast(
+    df: pd.DataFrame, site_id: str, prepared: Optional[pd.DataFrame] = None
+) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
     """
     Automatically handles recursive forecasting if future data (NaN targets) is detected.
+    `prepared` are features already computed for a history-only upload (see ChunkedFeatures).
+    Returns (rows sorted by datetime with forecast targets filled in, predictions per target).
     """
     
     # --- A. PREPARE ---
+    metrics.set_site(f"{site_number(site_id):g}")
     if "datetime" in df.columns:
         df = df.sort_values("datetime").reset_index(drop=True)
     
     # Init targets if missing (Essential for recursion)
     if "site" not in df.columns: 
-        # Extract numeric site ID
-        import re
-        try:
-            num = re.search(r'\d+', str(site_id))
-            val = float(num.group()) if num else 0.0
-            df["site"] = val
-        except:
-            df["site"] = 0.0
+        df["site"] = site_number(site_id)
             
     if "O3_target" not in df.columns: df["O3_target"] = np.nan
     if "NO2_target" not in df.columns: df["NO2_target"] = np.nan
@@ -380,40 +851,24 @@ async def run_forecast_pipeline(df: pd.DataFrame, site_id: str, resample: Option
     
     # --- B. EXECUTE ---
     if len(nan_indices) > 0:
-        # FUTURE DETECTED: Use Recursive Loop
-        start_idx = nan_indices[0]
-        
-        # 1. Loop through missing rows
-        window_size = 60
-        for i in range(start_idx, len(df)):
-            # Optimization: Slice window to avoid recalculating features for entire history
-            # We need enough history for lags (24h) + rolling windows (24h) -> ~48h + buffer
-            w_start = max(0, i - window_size)
-            w_end = i + 1
-            df_window = df.iloc[w_start:w_end].copy()
-            
-            # Recalculate features on small window
-            df_prep = prepare_features(df_window)
-            
-            # Take the last row (corresponding to current step 'i')
-            # prepare_features resets index, so it's always the last row
-            row_df = df_prep.iloc[[-1]].copy()
-            
-            # Predict single step
-            step_preds = predict_single_step(row_df)
-            
-            # Fill Gap in main dataframe
-            if "O3_target" in step_preds: df.at[i, "O3_target"] = step_preds["O3_target"][0]
-            if "NO2_target" in step_preds: df.at[i, "NO2_target"] = step_preds["NO2_target"][0]
-        
-        # 2. Final batch predict (to ensure consistent formatting/smoothing later)
-        final_prep = prepare_features(df)
-        preds_dict = predict_single_step(final_prep)
+        # FUTURE DETECTED: Incremental recursive engine (features built once, lag state in ring buffers),
+        # kept off the event loop so long horizons don't stall other requests
+        preds_dict, filled = await run_cpu_bound(forecast_recursive, df)
+        for t, (rows, values) in filled.items():
+            df.loc[rows, t] = values
         
     else:
         # HISTORY ONLY: Use Fast Batch Predict
-        df_prep = await run_in_threadpool(lambda: prepare_features(df))
+        df_prep = prepared if prepared is not None and len(prepared) == len(df) else await run_in_threadpool(lambda: prepare_features(df))
         preds_dict = await run_in_threadpool(lambda: predict_single_step(df_prep))
+    
+    return df, preds_dict
+
+async def run_forecast_pipeline(
+    df: pd.DataFrame, site_id: str, resample: Optional[str] = None, prepared: Optional[pd.DataFrame] = None
+) -> Dict[str, List[float]]:
+    """run_forecast + optional resampling, formatted as the forecast/timeseries response."""
+    df, preds_dict = await run_forecast(df, site_id, prepared)
 
     # --- C. RESAMPLING (Optional) ---
     if resample and isinstance(resample, str):
@@ -441,30 +896,75 @@ async def get_sites():
     """Return cached sites data (pre-computed at startup for fast response)"""
     if not sites_cache:
         raise HTTPException(status_code=404, detail="No sites data available")
-    return sites_cache
+    return ORJSONResponse(sites_cache)
 
 class ForecastByDateInput(BaseModel):
     site_id: str
     forecast_date: str  # YYYY-MM-DD format
 
+def input_date_for(forecast_date: str):
+    """The input day for a forecast date (predictable_date = available_date + 1)."""
+    from datetime import datetime, timedelta
+    try:
+        return datetime.strptime(forecast_date, "%Y-%m-%d") - timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date format: {forecast_date}. Use YYYY-MM-DD")
+
+def render_json(content: Any) -> bytes:
+    """Response body for `content` (orjson, NaN -> null)."""
+    return ORJSONResponse(content).body
+
+async def cached_forecast_by_date(site_id: str, forecast_date: str) -> bytes:
+    """Rendered by-date forecast, from the cache when possible (keyed by model version)."""
+    input_date = input_date_for(forecast_date)
+    key = (model_version, str(site_id), input_date.date())
+    metrics.set_site(f"{site_number(site_id):g}")
+    if forecast_cache is not None:
+        body = forecast_cache.get(key)
+        metrics.count_cache_lookup(body is not None)
+        if body is not None:
+            return body
+    
+    body = render_json(await compute_forecast_by_date(site_id, forecast_date))
+    if forecast_cache is not None:
+        forecast_cache.put(key, body)
+    return body
+
+async def warm_forecast_cache():
+    """Precompute every site's predictable dates in the background, one at a time."""
+    done = 0
+    evictions = forecast_cache.evictions if forecast_cache is not None else 0
+    for site in sites_cache:
+        for forecast_date in site.get("predictable_dates", []):
+            if forecast_cache is None:
+                return
+            # Once entries start being evicted, warming further would only churn the cache
+            if forecast_cache.evictions > evictions:
+                logger.info(f"Forecast cache warm-up stopped after {done} entries (cache full)")
+                return
+            try:
+                await cached_forecast_by_date(site["id"], forecast_date)
+                done += 1
+            except HTTPException:
+                continue
+            except Exception as e:
+                logger.warning(f"⚠️ Forecast cache warm-up failed for site {site['id']}, {forecast_date}: {e}")
+    logger.info(f"✅ Forecast cache warmed: {done} forecasts")
+
 @app.post("/forecast/by-date/")
 async def forecast_by_date(payload: ForecastByDateInput):
     """
-    Forecast for a specific date. Loads data from CSV automatically.
+    Forecast for a specific date. Served from the in-memory site data store.
     forecast_date is the date we want to predict FOR.
     We load the PREVIOUS day's data as input (since predictable_date = available_date + 1).
+    Responses are cached per (model version, site, date).
     """
-    from datetime import datetime, timedelta
-    
-    site_id = payload.site_id
-    forecast_date = payload.forecast_date
-    
+    body = await cached_forecast_by_date(payload.site_id, payload.forecast_date)
+    return Response(content=body, media_type="application/json")
+
+async def compute_forecast_by_date(site_id: str, forecast_date: str) -> Dict[str, Any]:
     # Parse forecast date and get the input date (previous day)
-    try:
-        target_date = datetime.strptime(forecast_date, "%Y-%m-%d")
-        input_date = target_date - timedelta(days=1)
-    except ValueError:
-        raise HTTPException(status_code=400, detail=f"Invalid date format: {forecast_date}. Use YYYY-MM-DD")
+    input_date = input_date_for(forecast_date)
     
     input_year = input_date.year
     input_month = input_date.month
@@ -472,50 +972,36 @@ async def forecast_by_date(payload: ForecastByDateInput):
     
     logger.info(f"Forecast date: {forecast_date}, Loading input data for: {input_year}-{input_month:02d}-{input_day:02d}")
     
-    # Try to load data from both unseen_input_data and train_data files
-    df_filtered = pd.DataFrame()
+    if site_store is None:
+        raise HTTPException(status_code=503, detail="Site data store not loaded")
     
-    for file_type in ["unseen_input_data", "train_data"]:
-        file_path = DATA_DIR / f"site_{site_id}_{file_type}.csv"
-        
-        if not file_path.exists():
-            continue
-        
-        try:
-            df = pd.read_csv(file_path)
-            
-            # Filter for the input date (24 hours before forecast date)
-            df_date = df[
-                (df["year"].astype(int) == input_year) & 
-                (df["month"].astype(int) == input_month) & 
-                (df["day"].astype(int) == input_day)
-            ].copy()
-            
-            if not df_date.empty:
-                df_filtered = df_date
-                logger.info(f"Found data in {file_type} for site {site_id}")
-                break
-                
-        except Exception as e:
-            logger.warning(f"Error reading {file_path}: {e}")
-            continue
+    # Unseen input data first, then train data; rows come back sorted by hour (max 24)
+    hit = site_store.get_day(site_id, input_date.date())
     
-    if df_filtered.empty:
+    if hit is None:
         raise HTTPException(
             status_code=404, 
             detail=f"No data found for date {input_year}-{input_month:02d}-{input_day:02d} in site {site_id}"
         )
     
+    file_type, df_filtered = hit
+    logger.info(f"Found data in {file_type} for site {site_id}")
+    
+    # The other sites' rows for the same day feed the cross-site (spatial) features, as in training
+    frames = {site_id: df_filtered}
+    if spatial_engine is not None:
+        for site in sites_cache:
+            if site_number(site["id"]) != site_number(site_id):
+                other = site_store.get_day(site["id"], input_date.date())
+                if other is not None:
+                    frames[site["id"]] = other[1]
+    
     try:
-        # Sort by hour and take 24 hours
-        df_filtered = df_filtered.sort_values("hour").head(24)
-        
         logger.info(f"Found {len(df_filtered)} data points for site {site_id}, date {input_year}-{input_month:02d}-{input_day:02d}")
         
-        # Create datetime column from year, month, day, hour
-        df_filtered["datetime"] = pd.to_datetime(
-            df_filtered[["year", "month", "day", "hour"]].astype(int).rename(columns={"hour": "hour"})
-        )
+        if len(frames) > 1:
+            # Forecast with the neighbours in lockstep and keep this site's result
+            return (await run_cpu_bound(forecast_sites_lockstep, frames))[site_id]
         
         # Run the forecast pipeline
         return await run_forecast_pipeline(df_filtered, site_id)
@@ -526,14 +1012,82 @@ async def forecast_by_date(payload: ForecastByDateInput):
         logger.error(f"Error loading data for site {site_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error loading data: {str(e)}")
 
-@app.post("/forecast/json/")
+class ForecastAllSitesInput(BaseModel):
+    forecast_date: str  # YYYY-MM-DD format
+    site_ids: Optional[List[str]] = None  # Defaults to every site in lat_lon_sites.txt
+
+def forecast_sites_lockstep(frames: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    """
+    Forecast several sites at once. Features are prepared per site (lags/rolling never
+    cross sites), spatial features across all of them, then all sites share one
+    recursive run: one predict call per horizon step.
+    """
+    preps = []
+    for site_id, df in frames.items():
+        df = df.copy()
+        df["site"] = site_number(site_id)
+        if "O3_target" not in df.columns: df["O3_target"] = np.nan
+        if "NO2_target" not in df.columns: df["NO2_target"] = np.nan
+        preps.append(prepare_features(df, spatial=False))
+    
+    df_prep = pd.concat(preps, ignore_index=True)
+    if spatial_engine is not None:
+        df_prep = add_spatial_features(df_prep)
+    preds_dict, _ = run_recursive_forecast(df_prep)
+    preds = {t: np.asarray(v) for t, v in preds_dict.items()}
+    
+    results = {}
+    start = 0
+    for site_id, prep in zip(frames, preps):
+        rows = slice(start, start + len(prep))
+        start += len(prep)
+        df_site = df_prep.iloc[rows].reset_index(drop=True)
+        results[site_id] = format_data_response(df_site, {t: v[rows].tolist() for t, v in preds.items()}, error_metrics=True)
+    return results
+
+@app.post("/forecast/by-date/all/")
+async def forecast_by_date_all(payload: ForecastAllSitesInput):
+    """
+    Forecast every site (or payload.site_ids) for one date, advancing all sites in lockstep.
+    Sites without data for the date are listed in "missing". With every site requested, per-site
+    results match /forecast/by-date/ (which also forecasts the requested site with all its
+    neighbours); a payload.site_ids subset only sees the listed sites as neighbours.
+    """
+    input_date = input_date_for(payload.forecast_date)
+    
+    if site_store is None:
+        raise HTTPException(status_code=503, detail="Site data store not loaded")
+    
+    site_ids = payload.site_ids or [s["id"] for s in sites_cache]
+    metrics.set_site("all")
+    frames = {}
+    missing = []
+    for site_id in site_ids:
+        hit = site_store.get_day(site_id, input_date.date())
+        if hit is None:
+            missing.append(site_id)
+        else:
+            frames[site_id] = hit[1]
+    
+    if not frames:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No data found for date {input_date:%Y-%m-%d} in any requested site"
+        )
+    
+    logger.info(f"Lockstep forecast for {payload.forecast_date}: {len(frames)} sites, missing {missing}")
+    
+    sites = await run_cpu_bound(forecast_sites_lockstep, frames)
+    return ORJSONResponse({"forecast_date": payload.forecast_date, "sites": sites, "missing": missing})
+
+@app.post("/forecast/json/", openapi_extra=FORECAST_BODY_DOC)
 async def forecast_json(
-    payload: JsonInput, 
+    payload: ForecastInput = Depends(forecast_input),
     resample: Optional[str] = Query(None, description="Resample frequency (e.g., 'D', 'W')")
 ):
-    df = pd.DataFrame(payload.data)
+    df = payload.df
     if "datetime" in df.columns: df["datetime"] = pd.to_datetime(df["datetime"])
-    return await run_forecast_pipeline(df, payload.site_id, resample)
+    return ORJSONResponse(await run_forecast_pipeline(df, payload.site_id, resample))
 
 @app.post("/forecast/file/")
 async def forecast_file(
@@ -541,51 +1095,51 @@ async def forecast_file(
     file: UploadFile = File(...),
     resample: Optional[str] = Query(None, description="Resample frequency (e.g., 'D', 'W')")
 ):
-    df = await parse_uploaded_file(file)
-    return await run_forecast_pipeline(df, site_id, resample)
+    df, prepared = await parse_uploaded_file(file, site_id)
+    return ORJSONResponse(await run_forecast_pipeline(df, site_id, resample, prepared))
 
 # --- B. Performance (12H Smoothed) ---
-@app.post("/plots/performance/json/")
-async def perf_json(payload: JsonInput):
-    df = pd.DataFrame(payload.data)
+@app.post("/plots/performance/json/", openapi_extra=FORECAST_BODY_DOC)
+async def perf_json(payload: ForecastInput = Depends(forecast_input)):
+    df = payload.df
     if "datetime" in df.columns: df["datetime"] = pd.to_datetime(df["datetime"])
-    return await process_view(df, payload.site_id, "performance")
+    return ORJSONResponse(await process_view(df, payload.site_id, "performance"))
 
 @app.post("/plots/performance/file/")
 async def perf_file(site_id: str = Form(...), file: UploadFile = File(...)):
-    df = await parse_uploaded_file(file)
-    return await process_view(df, site_id, "performance")
+    df, prepared = await parse_uploaded_file(file, site_id)
+    return ORJSONResponse(await process_view(df, site_id, "performance", prepared))
 
 # --- C. Diagnostic (6H Resampled) ---
-@app.post("/plots/diagnostic/json/")
-async def diag_json(payload: JsonInput):
-    df = pd.DataFrame(payload.data)
+@app.post("/plots/diagnostic/json/", openapi_extra=FORECAST_BODY_DOC)
+async def diag_json(payload: ForecastInput = Depends(forecast_input)):
+    df = payload.df
     if "datetime" in df.columns: df["datetime"] = pd.to_datetime(df["datetime"])
-    return await process_view(df, payload.site_id, "diagnostic")
+    return ORJSONResponse(await process_view(df, payload.site_id, "diagnostic"))
 
 @app.post("/plots/diagnostic/file/")
 async def diag_file(site_id: str = Form(...), file: UploadFile = File(...)):
-    df = await parse_uploaded_file(file)
-    return await process_view(df, site_id, "diagnostic")
+    df, prepared = await parse_uploaded_file(file, site_id)
+    return ORJSONResponse(await process_view(df, site_id, "diagnostic", prepared))
 
 # --- D. Time Series (Raw) ---
-@app.post("/plots/timeseries/json/")
-async def ts_json(payload: JsonInput):
-    df = pd.DataFrame(payload.data)
+@app.post("/plots/timeseries/json/", openapi_extra=FORECAST_BODY_DOC)
+async def ts_json(payload: ForecastInput = Depends(forecast_input)):
+    df = payload.df
     if "datetime" in df.columns: df["datetime"] = pd.to_datetime(df["datetime"])
-    return await run_forecast_pipeline(df, payload.site_id)
+    return ORJSONResponse(await run_forecast_pipeline(df, payload.site_id))
 
 @app.post("/plots/timeseries/file/")
 async def ts_file(site_id: str = Form(...), file: UploadFile = File(...)):
-    df = await parse_uploaded_file(file)
-    return await run_forecast_pipeline(df, site_id)
+    df, prepared = await parse_uploaded_file(file, site_id)
+    return ORJSONResponse(await run_forecast_pipeline(df, site_id, prepared=prepared))
 
 # --- E. Extreme Pollution ---
-@app.post("/plots/extreme/json/")
-async def extreme_json(payload: JsonInput, o3_thresh: float = 180.0, no2_thresh: float = 200.0):
-    df = pd.DataFrame(payload.data)
+@app.post("/plots/extreme/json/", openapi_extra=FORECAST_BODY_DOC)
+async def extreme_json(payload: ForecastInput = Depends(forecast_input), o3_thresh: float = 180.0, no2_thresh: float = 200.0):
+    df = payload.df
     if "datetime" in df.columns: df["datetime"] = pd.to_datetime(df["datetime"])
-    return await run_extreme_logic(df, payload.site_id, o3_thresh, no2_thresh)
+    return ORJSONResponse(await run_extreme_logic(df, payload.site_id, o3_thresh, no2_thresh))
 
 @app.post("/plots/extreme/file/")
 async def extreme_file(
@@ -594,15 +1148,72 @@ async def extreme_file(
     o3_thresh: float = 180.0,
     no2_thresh: float = 200.0
 ):
-    df = await parse_uploaded_file(file)
-    return await run_extreme_logic(df, site_id, o3_thresh, no2_thresh)
+    df, prepared = await parse_uploaded_file(file, site_id)
+    return ORJSONResponse(await run_extreme_logic(df, site_id, o3_thresh, no2_thresh, prepared))
+
+# --- F. Multi-View (one forecast, several panels) ---
+# Every view is derived from the input rows plus the forecast lists of one pipeline run
+VIEWS = ["timeseries", "performance", "diagnostic", "extreme"]
+
+@app.post("/plots/views/json/", openapi_extra=FORECAST_BODY_DOC)
+async def views_json(
+    payload: ForecastInput = Depends(forecast_input),
+    views: List[str] = Query(VIEWS, description=f"Any of {', '.join(VIEWS)}"),
+    o3_thresh: float = 180.0,
+    no2_thresh: float = 200.0
+):
+    df = payload.df
+    if "datetime" in df.columns: df["datetime"] = pd.to_datetime(df["datetime"])
+    return ORJSONResponse(await run_views(df, payload.site_id, views, o3_thresh, no2_thresh))
+
+@app.post("/plots/views/file/")
+async def views_file(
+    site_id: str = Form(...),
+    file: UploadFile = File(...),
+    views: List[str] = Query(VIEWS, description=f"Any of {', '.join(VIEWS)}"),
+    o3_thresh: float = 180.0,
+    no2_thresh: float = 200.0
+):
+    df, prepared = await parse_uploaded_file(file, site_id)
+    return ORJSONResponse(await run_views(df, site_id, views, o3_thresh, no2_thresh, prepared))
 
 # --- Shared View Logic ---
-async def process_view(df, site_id, view_type):
-    preds_dict = await run_forecast_pipeline(df, site_id)
+
+async def process_view(df, site_id, view_type, prepared=None):
+    preds_dict = await run_forecast_pipeline(df, site_id, prepared=prepared)
+    return smoothed_view(df, preds_dict["forecast"], view_type)
+
+async def run_extreme_logic(df, site_id, o3_thresh, no2_thresh, prepared=None):
+    preds_dict = await run_forecast_pipeline(df, site_id, prepared=prepared)
+    return extreme_view(df, preds_dict["forecast"], o3_thresh, no2_thresh)
+
+async def run_views(df, site_id, views, o3_thresh, no2_thresh, prepared=None):
+    """Forecast once, then build each requested view from the shared predictions."""
+    unknown = [v for v in views if v not in VIEWS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown views {unknown}, expected any of {VIEWS}")
     
+    forecast_df, preds_dict = await run_forecast(df, site_id, prepared)
+    
+    def build():
+        timeseries = format_data_response(forecast_df, preds_dict, error_metrics=True)
+        forecast = timeseries["forecast"]
+        result = {}
+        for view in dict.fromkeys(views):
+            if view == "timeseries":
+                result[view] = timeseries
+            elif view == "extreme":
+                result[view] = extreme_view(df.copy(), forecast, o3_thresh, no2_thresh)
+            else:
+                result[view] = smoothed_view(df.copy(), forecast, view)
+        return result
+    
+    return await run_in_threadpool(build)
+
+def smoothed_view(df, forecast, view_type):
+    """12H rolling ("performance") or 6H resampled ("diagnostic") actuals and predictions."""
     # Flatten for manipulation
-    for k, v in preds_dict["forecast"].items():
+    for k, v in forecast.items():
         df[f"{k}_pred"] = v
     
     if view_type == "performance":
@@ -620,9 +1231,9 @@ async def process_view(df, site_id, view_type):
     final_preds = {k.replace("_pred", ""): df[k].tolist() for k in df.columns if "_pred" in k}
     return format_data_response(df, final_preds, error_metrics=True)
 
-async def run_extreme_logic(df, site_id, o3_thresh, no2_thresh):
-    preds_dict = await run_forecast_pipeline(df, site_id)
-    for k, v in preds_dict["forecast"].items(): df[f"{k}_pred"] = v
+def extreme_view(df, forecast, o3_thresh, no2_thresh):
+    """Rows where either target exceeds its threshold."""
+    for k, v in forecast.items(): df[f"{k}_pred"] = v
     
     mask = pd.Series([False]*len(df), index=df.index)
     if "O3_target" in df.columns: mask |= (df["O3_target"] > o3_thresh)
@@ -636,12 +1247,12 @@ async def run_extreme_logic(df, site_id, o3_thresh, no2_thresh):
 # 3. LEGACY / WEBSOCKET
 # ==============================================================================
 
-@app.post("/predict/")
-async def predict_simple(input_data: JsonInput):
-    df = pd.DataFrame(input_data.data)
+@app.post("/predict/", openapi_extra=FORECAST_BODY_DOC)
+async def predict_simple(input_data: ForecastInput = Depends(forecast_input)):
+    df = input_data.df
     # Run pipeline and get full response with actual vs predicted
     res = await run_forecast_pipeline(df, input_data.site_id)
-    return {
+    return ORJSONResponse({
         "site_id": input_data.site_id,
         "dates": res.get("dates", []),
         "actual": res.get("actual", {}),
@@ -649,7 +1260,7 @@ async def predict_simple(input_data: JsonInput):
         "predicted": res.get("predicted", {}),
         "forecast": res.get("forecast", {}),
         "metrics": res.get("metrics", {})
-    }
+    })
 
 @app.websocket("/ws/predict/")
 async def websocket_predict(websocket: WebSocket):
@@ -658,7 +1269,7 @@ async def websocket_predict(websocket: WebSocket):
         while True:
             data = await websocket.receive_text()
             input_data = json.loads(data)
-            df = pd.DataFrame(input_data["data"])
+            df = typed_input(pd.DataFrame(input_data["data"]))
             
             # Run full pipeline to ensure lags are handled correctly
             res = await run_forecast_pipeline(df, input_data.get("site_id", "1"))
@@ -672,13 +1283,254 @@ async def websocket_predict(websocket: WebSocket):
                 "forecast": res.get("forecast", {}),
                 "metrics": res.get("metrics", {})
             }
-            await websocket.send_text(json.dumps(ws_response))
+            await websocket.send_text(orjson.dumps(ws_response, option=orjson.OPT_SERIALIZE_NUMPY).decode())
     except WebSocketDisconnect:
         print("WebSocket disconnected")
 
+class SessionSite:
+    """One site of a /ws/session/ socket: committed lag/rolling state and the last observed hour."""
+    
+    def __init__(self, site_id: str):
+        self.site_id = site_id
+        self.site = site_number(site_id)
+        self.state = SiteState(TARGETS)
+        self.last_time: Optional[pd.Timestamp] = None
+        self.observed = 0
+
+def advance_session(site: SessionSite, df: pd.DataFrame, emit: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    Feed only the new rows of a session site (runs in a worker thread). Observed rows get
+    their lags from the site's state, are committed to it and batch predicted. From the first
+    row without an O3_target on, rows are forecast recursively on a copy of the state (they
+    are not committed) and each step is emitted as soon as it is predicted.
+    """
+    df["site"] = site.site
+    for t in TARGETS:
+        if t not in df.columns: df[t] = np.nan
+    df = df.sort_values("datetime", kind="stable").reset_index(drop=True)
+    times = df["datetime"]
+    if times.isna().any() or times.duplicated().any():
+        raise ValueError("Rows need unique, valid datetimes")
+    if site.last_time is not None and times.iloc[0] <= site.last_time:
+        raise ValueError(f"Rows must be after the last observed hour {site.last_time}")
+    
+    future = df["O3_target"].isna().cummax().to_numpy()
+    hist = ~future
+    targets = {t: df[t].to_numpy(dtype=np.float64) for t in TARGETS}
+    
+    # Lag/rolling columns come from the state, so prepare_features only adds ERA5, spatial and time features
+    state = site.state.copy()
+    for col, values in state.observe({t: v[hist] for t, v in targets.items()}).items():
+        df[col] = np.nan
+        df.loc[hist, col] = values
+    df_prep = prepare_features(df)
+    for col in FEATURE_COLS:
+        if col not in df_prep.columns: df_prep[col] = 0.0
+    X = df_prep[FEATURE_COLS].to_numpy(dtype=np.float64)
+    dates = format_timestamps(df_prep["datetime"])
+    
+    if hist.any():
+        preds = predict_rows(X[hist])
+        emit({
+            "type": "history",
+            "site_id": site.site_id,
+            "dates": [d for d, h in zip(dates, hist) if h],
+            "actual": {t: finite_list(targets[t][hist]) for t in TARGETS},
+            "predicted": {t: finite_list(v) for t, v in preds.items()},
+        })
+    
+    rows = np.flatnonzero(future)
+    step = 0
+    
+    def predict_step(block: np.ndarray) -> Dict[str, np.ndarray]:
+        nonlocal step
+        preds = predict_rows(block)
+        emit({
+            "type": "step",
+            "site_id": site.site_id,
+            "step": step,
+            "date": dates[rows[step]],
+            "forecast": {t: finite_list(v)[0] for t, v in preds.items()},
+        })
+        step += 1
+        return preds
+    
+    if len(rows):
+        sites = df_prep["site"].to_numpy()
+        with metrics.stage("recursive_loop", len(rows)):
+            run_recursive(X, sites, targets, future, FEATURE_LAYOUT, tracing.traced_steps(predict_step),
+                          df_prep["datetime"].to_numpy(), spatial_engine, states={sites[0]: state.copy()})
+        metrics.count_recursive_steps(len(rows))
+    
+    site.state = state
+    if hist.any():
+        site.last_time = times[hist].iloc[-1]
+        site.observed += int(hist.sum())
+    return {"type": "done", "site_id": site.site_id, "observed": int(hist.sum()), "steps": len(rows), "state_rows": site.observed}
+
+@app.websocket("/ws/session/")
+async def websocket_session(websocket: WebSocket):
+    """
+    Stateful forecasting session. Each message ({"site_id", "data": [...]}, text or binary JSON)
+    carries only the new hourly rows of a site; its lag state is kept here between messages.
+    Replies are binary frames of JSON: "history" (predictions for the observed rows), one "step"
+    per recursive forecast hour as soon as it is computed, then "done". {"site_id", "reset": true}
+    drops a site's state. A message that fails gets an "error" frame and leaves the site's state
+    as it was; the socket stays open.
+    """
+    await websocket.accept()
+    sender = FrameSender(websocket, WS_SEND_QUEUE, WS_SEND_TIMEOUT)
+    sender.start()
+    sites: Dict[str, SessionSite] = {}
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                request = orjson.loads(message.get("bytes") or message.get("text") or b"")
+                site_id = str(request.get("site_id", "1"))
+                if request.get("reset"):
+                    sites.pop(site_id, None)
+                    await sender.send({"type": "reset", "site_id": site_id})
+                    continue
+                df = typed_input(pd.DataFrame(request.get("data") or []))
+                if "datetime" not in df.columns:
+                    raise ValueError("Rows need a datetime column")
+                df["datetime"] = pd.to_datetime(df["datetime"])
+                site = sites.setdefault(site_id, SessionSite(site_id))
+                metrics.set_site(f"{site.site:g}")
+                done = await run_in_threadpool(advance_session, site, df, sender.send_threadsafe)
+                await sender.send(done)
+            except SlowConsumer:
+                raise
+            except (ValueError, TypeError, AttributeError) as e:
+                await sender.send({"type": "error", "detail": str(e)})
+            except Exception as e:
+                # A failed message commits nothing to the site state, so the session stays usable
+                logger.warning(f"⚠️ WebSocket session message failed: {e!r}")
+                await sender.send({"type": "error", "detail": f"Internal error: {e}"})
+    except SlowConsumer as e:
+        logger.warning(f"⚠️ Closing slow WebSocket session: {e}")
+        await sender.stop(flush=False)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ Closing WebSocket session after an internal error: {e!r}")
+        await sender.stop(flush=False)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close(code=1011)
+    finally:
+        await sender.stop()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus exposition: stage latency histograms, request latency, counters, threadpool load."""
+    if metrics.prom is None:
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    pool = anyio.to_thread.current_default_thread_limiter().statistics()
+    metrics.set_threadpool(pool.borrowed_tokens, pool.tasks_waiting)
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@app.get("/debug/traces/")
+def debug_traces(limit: int = Query(200, ge=1, le=tracing.MEMORY_SPANS)):
+    """Newest spans of the in-process exporter (only used when no OTLP endpoint is configured)."""
+    if tracing.memory_exporter is None:
+        raise HTTPException(status_code=404, detail="Spans are exported over OTLP, not kept in-process")
+    return tracing.recent_spans(limit)
+
+# --- Admin: on-demand profiler ---
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def require_single_process():
+    # A session lives in one worker, but arm / result / stop calls are spread over all of them
+    if worker_processes > 1:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Profiling needs a single worker process ({worker_processes} are serving); "
+                   "run the launcher with --workers 1 or uvicorn directly",
+        )
+
+class ProfileRequest(BaseModel):
+    endpoint: Optional[str] = None  # e.g. "/forecast/by-date/"; None = every endpoint
+    requests: int = Field(0, ge=0)  # Stop after this many matching requests (0 = only the time limit)
+    seconds: float = Field(60, gt=0, le=profiler.MAX_SECONDS)
+    interval_ms: float = Field(5, ge=1, le=1000)
+    tracemalloc: bool = True
+    memory_top: int = Field(25, ge=1, le=500)
+
+@app.post("/admin/profile/", dependencies=[Depends(require_admin), Depends(require_single_process)])
+def arm_profiler(req: ProfileRequest):
+    """Arm the sampling profiler for the next `requests` requests to `endpoint` and/or `seconds`."""
+    if req.endpoint is not None and req.endpoint not in {getattr(route, "path", None) for route in app.routes}:
+        raise HTTPException(status_code=400, detail=f"Unknown endpoint {req.endpoint}")
+    try:
+        session = profiler.arm(
+            endpoint=req.endpoint, max_requests=req.requests, seconds=req.seconds,
+            interval=req.interval_ms / 1000, trace_memory=req.tracemalloc, memory_top=req.memory_top,
+        )
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Profiler armed: {session.status()}")
+    return session.status()
+
+@app.get("/admin/profile/", dependencies=[Depends(require_admin), Depends(require_single_process)])
+async def profile_result(
+    format: str = Query("summary", pattern="^(summary|collapsed|speedscope)$"),
+    wait: float = Query(0, ge=0, le=profiler.MAX_SECONDS, description="Seconds to wait for the session to finish"),
+):
+    """Summary (hot functions + tracemalloc top-list), collapsed stacks or a speedscope file."""
+    session = profiler.current
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profile has been armed")
+    if wait and not session.done.is_set():
+        await run_in_threadpool(session.done.wait, wait)
+    if not session.done.is_set():
+        if format == "summary":
+            return session.status()
+        raise HTTPException(status_code=409, detail="Profiling session still running")
+    if format == "collapsed":
+        return Response(session.collapsed(), media_type="text/plain",
+                        headers={"Content-Disposition": 'attachment; filename="profile.collapsed.txt"'})
+    if format == "speedscope":
+        return ORJSONResponse(session.speedscope(),
+                              headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'})
+    return session.summary()
+
+@app.delete("/admin/profile/", dependencies=[Depends(require_admin), Depends(require_single_process)])
+async def stop_profiler():
+    """Stop the running session early (its results stay available)."""
+    session = profiler.current
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profile has been armed")
+    session.stop()
+    await run_in_threadpool(session.done.wait)
+    return session.status()
+
 @app.get("/health/")
 def health_check():
-    return {"status": "ok", "models": list(models.keys())}
+    return {
+        "status": "ok",
+        "models": list(models.keys()),
+        "forecast_workers": worker_pool.size(),
+        "microbatch": batcher.stats() if batcher is not None else None,
+        "model_version": model_version,
+        "forecast_cache": forecast_cache.stats() if forecast_cache is not None else None,
+    }
+
+@app.get("/ready/")
+def readiness_check():
+    """Readiness, unlike /health/ (liveness): 503 until the boosters are loaded and warmed up."""
+    body = {"ready": ready, "models": list(models.keys()), "startup_seconds": startup_times}
+    return ORJSONResponse(body, status_code=200 if ready else 503)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Memory-resident store for the per-site CSV files.
+
+Every site_{id}_{file_type}.csv is parsed once, kept as a columnar NumPy block
+(rows ordered by date + hour) and indexed by calendar day, so pulling one day
+of input for /forecast/by-date/ is a dict lookup plus an array slice.
+
+With load(lazy=True) files are only registered at startup and each one is parsed
+the first time its site is queried; day_keys() then scans just the date columns
+of files that have not been parsed yet.
+"""
+
+import logging
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("AirQualityServer")
+
+# Lookup priority matches the original by-date behaviour: unseen data first.
+SITE_FILE_TYPES = ["unseen_input_data", "train_data"]
+DATE_COLS = ["year", "month", "day", "hour"]
+HOURS_PER_DAY = 24
+
+
+def day_key(year, month, day):
+    """Integer YYYYMMDD key (works on scalars and arrays)."""
+    return year * 10000 + month * 100 + day
+
+
+class SiteTable:
+    """One site CSV as a float64 block + per-day row ranges."""
+
+    def __init__(self, columns, values: np.ndarray, datetimes: np.ndarray, day_index: Dict[int, Tuple[int, int]]):
+        self.columns = list(columns)
+        self.values = values
+        self.datetimes = datetimes
+        self.day_index = day_index
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SiteTable":
+        df = df.apply(pd.to_numeric, errors="coerce")
+        df = df.dropna(subset=DATE_COLS)
+
+        parts = df[DATE_COLS].to_numpy(dtype=np.int64)
+        keys = day_key(parts[:, 0], parts[:, 1], parts[:, 2])
+        # Stable so duplicate hours keep file order (same as filter + sort_values("hour"))
+        order = np.lexsort((parts[:, 3], keys))
+        keys = keys[order]
+        parts = parts[order]
+
+        values = np.ascontiguousarray(df.to_numpy(dtype=np.float64)[order])
+        datetimes = pd.to_datetime(
+            pd.DataFrame(parts, columns=DATE_COLS)
+        ).to_numpy()
+
+        uniq, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+        day_index = {
+            int(k): (int(s), int(s + min(c, HOURS_PER_DAY)))
+            for k, s, c in zip(uniq, starts, counts)
+        }
+        return cls(df.columns, values, datetimes, day_index)
+
+    @property
+    def n_rows(self) -> int:
+        return self.values.shape[0]
+
+    def day_keys(self) -> np.ndarray:
+        return np.fromiter(self.day_index.keys(), dtype=np.int64, count=len(self.day_index))
+
+    def get_day(self, key: int) -> Optional[pd.DataFrame]:
+        span = self.day_index.get(key)
+        if span is None:
+            return None
+        start, stop = span
+        df = pd.DataFrame(self.values[start:stop], columns=self.columns)
+        df["datetime"] = self.datetimes[start:stop]
+        return df
+
+
+def scan_day_keys(path: Path) -> np.ndarray:
+    """Sorted unique day keys of a site CSV, reading only its date columns."""
+    parts = pd.read_csv(path, usecols=DATE_COLS).apply(pd.to_numeric, errors="coerce").dropna()
+    parts = parts.to_numpy(dtype=np.int64)
+    return np.unique(day_key(parts[:, 0], parts[:, 1], parts[:, 2]))
+
+
+class SiteDataStore:
+    """All site tables, keyed by (site_id, file_type)."""
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self.tables: Dict[Tuple[str, str], SiteTable] = {}
+        self.pending: Dict[Tuple[str, str], Path] = {}  # registered by load(lazy=True), not parsed yet
+        self.lazy = False
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update({"pending": {}, "lazy": False, **state})
+        self._lock = threading.Lock()
+
+    def file_path(self, site_id, file_type: str) -> Path:
+        return self.data_dir / f"site_{site_id}_{file_type}.csv"
+
+    def load(self, site_ids: Iterable[int] = range(1, 8), lazy: bool = False) -> "SiteDataStore":
+        self.lazy = lazy
+        for site_id in site_ids:
+            for file_type in SITE_FILE_TYPES:
+                path = self.file_path(site_id, file_type)
+                if not path.exists():
+                    continue
+                if lazy:
+                    self.pending[(str(site_id), file_type)] = path
+                else:
+                    self._parse((str(site_id), file_type), path)
+        if lazy:
+            logger.info(f"✅ Site data store: {len(self.pending)} files registered, parsed per site on first use")
+        else:
+            total = sum(t.n_rows for t in self.tables.values())
+            logger.info(f"✅ Site data store loaded: {len(self.tables)} files, {total} rows")
+        return self
+
+    def _parse(self, key: Tuple[str, str], path: Path):
+        try:
+            self.tables[key] = SiteTable.from_frame(pd.read_csv(path))
+        except Exception as e:
+            logger.warning(f"Error loading {path}: {e}")
+
+    def table(self, site_id, file_type: str) -> Optional[SiteTable]:
+        key = (str(site_id), file_type)
+        table = self.tables.get(key)
+        if table is None and self.lazy:
+            with self._lock:
+                path = self.pending.pop(key, None)
+                if path is not None:
+                    self._parse(key, path)
+                    logger.info(f"Site data store: parsed {path.name}")
+                table = self.tables.get(key)
+        return table
+
+    def day_keys(self, site_id) -> np.ndarray:
+        """Sorted unique day keys (YYYYMMDD) with rows in any of the site's files."""
+        keys = []
+        for file_type in SITE_FILE_TYPES:
+            key = (str(site_id), file_type)
+            if key in self.tables:
+                keys.append(self.tables[key].day_keys())
+            elif key in self.pending:
+                keys.append(scan_day_keys(self.pending[key]))
+        return np.unique(np.concatenate(keys)) if keys else np.array([], dtype=np.int64)
+
+    def get_day(self, site_id: str, day: date) -> Optional[Tuple[str, pd.DataFrame]]:
+        """
+        Return (file_type, rows) for one calendar day, at most 24 rows sorted by hour.
+        Unseen data wins over train data, as in the original CSV scan.
+        """
+        key = day_key(day.year, day.month, day.day)
+        for file_type in SITE_FILE_TYPES:
+            table = self.table(site_id, file_type)
+            if table is None:
+                continue
+            df = table.get_day(key)
+            if df is not None:
+                return file_type, df
+        return None
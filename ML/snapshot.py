@@ -0,0 +1,102 @@
+"""
+Binary startup snapshot.
+
+Parsing the site CSVs and the ERA5 table dominates boot time, so the parsed
+state is pickled to disk together with a fingerprint of every source file.
+On the next boot the snapshot is reused as long as the sources are unchanged.
+
+File layout: two consecutive pickles, a small header (format version + source
+fingerprints) followed by the payload, so a stale snapshot is rejected without
+unpickling the payload.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger("AirQualityServer")
+
+SNAPSHOT_VERSION = 2
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint_sources(paths: Iterable[Path], with_hash: bool = True) -> Dict[str, Dict[str, Any]]:
+    """{path: {size, mtime_ns, sha256}} for every source that exists."""
+    out = {}
+    for path in paths:
+        path = Path(path)
+        if not path.exists():
+            continue
+        st = path.stat()
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if with_hash:
+            entry["sha256"] = _sha256(path)
+        out[str(path)] = entry
+    return out
+
+
+def _sources_match(saved: Dict[str, Dict[str, Any]], paths: Iterable[Path]) -> bool:
+    current = fingerprint_sources(paths, with_hash=False)
+    if set(saved) != set(current):
+        return False
+    for key, cur in current.items():
+        old = saved[key]
+        if old["size"] != cur["size"]:
+            return False
+        # mtime can change without content changing (git checkout, docker COPY),
+        # so only fall back to hashing when it differs
+        if old["mtime_ns"] != cur["mtime_ns"] and old.get("sha256") != _sha256(Path(key)):
+            return False
+    return True
+
+
+def read_snapshot(path: Path, sources: Iterable[Path]) -> Optional[Dict[str, Any]]:
+    """Return the snapshot payload, or None if missing, unreadable or stale."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    sources = list(sources)
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)
+            if header.get("version") != SNAPSHOT_VERSION:
+                logger.info("Startup snapshot has an old format, rebuilding")
+                return None
+            if not _sources_match(header.get("sources", {}), sources):
+                logger.info("Startup snapshot is stale (source files changed), rebuilding")
+                return None
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read startup snapshot {path}: {e}")
+        return None
+
+
+def write_snapshot(path: Path, sources: Iterable[Path], payload: Dict[str, Any]) -> bool:
+    """Atomically write header + payload; failures are logged, never raised."""
+    path = Path(path)
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        header = {"version": SNAPSHOT_VERSION, "sources": fingerprint_sources(sources)}
+        with open(tmp, "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not write startup snapshot {path}: {e}")
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return False
@@ -0,0 +1,150 @@
+"""
+Inference-time spatial (cross-site) features.
+
+Mirrors utilities/train-dataset-engineered.py, which the production models were
+trained on. For every timestamp, over the sites present at that timestamp:
+
+    {P}_city_mean_lag1  mean of P_lag_1h across sites
+    {P}_city_std_lag1   std (ddof=1) of P_lag_1h across sites, NaN -> 0
+    {P}_idw_lag1        inverse-distance (haversine, power 2) weighted mean of the
+                        *other* sites' P_lag_1h; falls back to the site's own lag1
+                        when there are no neighbours or a neighbour value is NaN
+    {P}_diff_mean_lag1  P_lag_1h - city mean, NaN -> 0
+
+The weight matrix is built once from the site registry; per timestamp the IDW
+term is a single matrix-vector product.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+POLLUTANTS = ["O3", "NO2"]
+
+
+def lag1_col(pollutant: str) -> str:
+    return f"{pollutant}_lag_1h"
+
+
+def spatial_cols(pollutant: str) -> List[str]:
+    """Output columns for one pollutant: city mean, city std, idw, diff."""
+    return [
+        f"{pollutant}_city_mean_lag1",
+        f"{pollutant}_city_std_lag1",
+        f"{pollutant}_idw_lag1",
+        f"{pollutant}_diff_mean_lag1",
+    ]
+
+
+def haversine_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km."""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class SpatialFeatureEngine:
+    """Precomputed IDW weights for the registered sites."""
+
+    def __init__(self, site_ids: Iterable[float], lats, lons, power: float = 2.0, eps: float = 1e-6):
+        self.site_ids = [float(s) for s in site_ids]
+        self.index = {s: i for i, s in enumerate(self.site_ids)}
+        w = 1.0 / (haversine_matrix(lats, lons) + eps) ** power
+        np.fill_diagonal(w, 0.0)
+        self.weights = w
+
+    @classmethod
+    def from_sites(cls, sites: List[Dict]) -> Optional["SpatialFeatureEngine"]:
+        """Build from the /sites/ payload (id, latitude, longitude)."""
+        if not sites:
+            return None
+        return cls(
+            [float(s["id"]) for s in sites],
+            [float(s["latitude"]) for s in sites],
+            [float(s["longitude"]) for s in sites],
+        )
+
+    def weights_for(self, sites: np.ndarray) -> np.ndarray:
+        """Weight submatrix for the given sites; unknown sites get no neighbours."""
+        idx = np.array([self.index.get(_as_float(s), -1) for s in sites], dtype=np.int64)
+        known = idx >= 0
+        w = np.zeros((len(idx), len(idx)))
+        w[np.ix_(known, known)] = self.weights[np.ix_(idx[known], idx[known])]
+        return w
+
+    @staticmethod
+    def _features(values: np.ndarray, present: np.ndarray, weights: np.ndarray) -> List[np.ndarray]:
+        """
+        values/present: (T, m) lag1 values and row-presence per (timestamp, site).
+        Returns [mean, std, idw, diff], each (T, m).
+        """
+        valid = present & ~np.isnan(values)
+        vz = np.where(valid, values, 0.0)
+        cnt = valid.sum(axis=1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = vz.sum(axis=1) / cnt
+            dev = np.where(valid, values - mean[:, None], 0.0)
+            std = np.sqrt((dev ** 2).sum(axis=1) / (cnt - 1))
+            std[cnt < 2] = np.nan
+
+            num = vz @ weights.T
+            den = present.astype(np.float64) @ weights.T
+            nan_neighbour = (present & np.isnan(values)).astype(np.float64) @ weights.T > 0
+            idw = np.where((den > 0) & ~nan_neighbour, num / den, values)
+
+        mean = np.broadcast_to(mean[:, None], values.shape)
+        std = np.nan_to_num(np.broadcast_to(std[:, None], values.shape), nan=0.0)
+        diff = np.nan_to_num(values - mean, nan=0.0)
+        return [mean, std, idw, diff]
+
+    def compute(self, sites: np.ndarray, lag1: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        One timestamp: `sites` are the sites present, lag1[P] their P_lag_1h values.
+        Returns {column: (m,) array}.
+        """
+        weights = self.weights_for(sites)
+        present = np.ones((1, len(sites)), dtype=bool)
+        out = {}
+        for p, vals in lag1.items():
+            feats = self._features(np.asarray(vals, dtype=np.float64)[None, :], present, weights)
+            for col, f in zip(spatial_cols(p), feats):
+                out[col] = f[0]
+        return out
+
+    def compute_frame(self, times: np.ndarray, sites: np.ndarray, lag1: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Long-format rows (timestamp, site, lag1 values) -> per-row spatial features.
+        Rows are pivoted to a (time x site) grid so each timestamp is one mat-vec.
+        """
+        t_codes, _ = _factorize(times)
+        s_codes, s_uniq = _factorize(sites)
+        shape = (t_codes.max() + 1 if len(t_codes) else 0, len(s_uniq))
+        weights = self.weights_for(s_uniq)
+
+        present = np.zeros(shape, dtype=bool)
+        present[t_codes, s_codes] = True
+
+        out = {}
+        for p, vals in lag1.items():
+            grid = np.full(shape, np.nan)
+            grid[t_codes, s_codes] = vals
+            for col, f in zip(spatial_cols(p), self._features(grid, present, weights)):
+                out[col] = f[t_codes, s_codes]
+        return out
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _factorize(values: np.ndarray):
+    uniq, codes = np.unique(values, return_inverse=True)
+    return codes.reshape(-1), uniq
@@ -0,0 +1,219 @@
+"""
+Per-request tracing: Server-Timing headers and OpenTelemetry spans.
+
+Every stage timed through metrics.stage() (upload parsing, prepare_features,
+ERA5 join, recursive loop, per-target predict, formatting) is also
+
+    - added to the request's Server-Timing header, summed per stage with the
+      call count, e.g. `predict_O3_target;dur=41.2;desc="168 calls"`, so the
+      breakdown shows up in the browser's network tab
+    - recorded as an OpenTelemetry span under the request's server span, with
+      one `recursive_step` span per step of the recursive loop
+
+Spans go to the OTLP/HTTP endpoint in OTEL_EXPORTER_OTLP_TRACES_ENDPOINT (or
+OTEL_EXPORTER_OTLP_ENDPOINT + /v1/traces). Without one they are kept in a small
+in-process buffer (recent_spans()) for local testing. An incoming `traceparent`
+header is honoured, so requests from the web app continue the caller's trace.
+
+The opentelemetry packages are optional; without them only Server-Timing is
+produced.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from opentelemetry import context as otel_context, propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+except ImportError:  # pragma: no cover - optional dependency
+    trace = None
+    SpanExporter = object
+
+MEMORY_SPANS = 2000
+
+tracer = trace.get_tracer("sih-ml") if trace is not None else None
+provider = None
+memory_exporter: Optional["MemorySpanExporter"] = None
+
+
+class ServerTiming:
+    """Stage durations of one request, summed per stage name (in first-seen order)."""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}  # name -> [seconds, calls]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self, total: float) -> str:
+        with self._lock:
+            parts = [
+                f'{name};dur={seconds * 1000:.2f}' + (f';desc="{calls} calls"' if calls > 1 else "")
+                for name, (seconds, calls) in self.stages.items()
+            ]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+server_timing: ContextVar[Optional[ServerTiming]] = ContextVar("server_timing", default=None)
+
+
+class MemorySpanExporter(SpanExporter):
+    """Keeps the last `max_spans` finished spans in memory."""
+
+    def __init__(self, max_spans: int = MEMORY_SPANS):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, spans):
+        self.spans.extend(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def otlp_endpoint() -> Optional[str]:
+    endpoint = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+    if not endpoint and os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        endpoint = os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"].rstrip("/") + "/v1/traces"
+    return endpoint
+
+
+def setup(service_name: str = "sih-ml") -> str:
+    """Install the tracer provider; returns where spans are exported to."""
+    global provider, memory_exporter
+    if trace is None:
+        return "disabled (opentelemetry not installed)"
+    if provider is not None:
+        return "memory" if memory_exporter is not None else otlp_endpoint()
+
+    endpoint = otlp_endpoint()
+    if endpoint:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=endpoint)
+    else:
+        exporter = memory_exporter = MemorySpanExporter()
+    provider = TracerProvider(resource=Resource.create({"service.name": os.environ.get("OTEL_SERVICE_NAME", service_name)}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return endpoint or "memory"
+
+
+def shutdown():
+    if provider is not None:
+        provider.shutdown()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current one (a no-op without opentelemetry)."""
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+def record(name: str, seconds: float):
+    """Add a stage duration to the current request's Server-Timing header."""
+    timing = server_timing.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+def traced_steps(predict_fn: Callable) -> Callable:
+    """Wrap a recursive-loop predict callback so every call is a `recursive_step` span."""
+    step = 0
+
+    def predict_step(X):
+        nonlocal step
+        start = time.perf_counter()
+        with span("recursive_step", step=step, rows=len(X)):
+            preds = predict_fn(X)
+        record("recursive_step", time.perf_counter() - start)
+        step += 1
+        return preds
+
+    return predict_step
+
+
+def recent_spans(limit: int = 200) -> List[Dict[str, Any]]:
+    """Newest spans from the in-process exporter (empty when exporting over OTLP)."""
+    if memory_exporter is None:
+        return []
+    spans = list(memory_exporter.spans)[-limit:]
+    return [
+        {
+            "name": s.name,
+            "trace_id": f"{s.context.trace_id:032x}",
+            "span_id": f"{s.context.span_id:016x}",
+            "parent_id": f"{s.parent.span_id:016x}" if s.parent is not None else None,
+            "start_ns": s.start_time,
+            "duration_ms": (s.end_time - s.start_time) / 1e6,
+            "attributes": dict(s.attributes or {}),
+        }
+        for s in reversed(spans)
+    ]
+
+
+class TracingMiddleware:
+    """ASGI middleware: server span per HTTP request and the Server-Timing response header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timing = ServerTiming()
+        token = server_timing.set(timing)
+        start = time.perf_counter()
+        root = otel_token = None
+        # Newer FastAPI releases open their own server span (not made current); nest under it
+        native = getattr(scope.get("fastapi.telemetry"), "span", None)
+        if native is not None:
+            otel_token = otel_context.attach(trace.set_span_in_context(native))
+        elif tracer is not None:
+            carrier = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+            root = tracer.start_span(
+                f"{scope['method']} {scope['path']}",
+                context=propagate.extract(carrier),
+                kind=trace.SpanKind.SERVER,
+                attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+            )
+            otel_token = otel_context.attach(trace.set_span_in_context(root))
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                if timing.stages:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timing.header(time.perf_counter() - start).encode()))
+                    message = {**message, "headers": headers}
+                if root is not None:
+                    root.set_attribute("http.response.status_code", message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception as e:
+            if root is not None:
+                root.record_exception(e)
+                root.set_status(trace.StatusCode.ERROR)
+            raise
+        finally:
+            server_timing.reset(token)
+            if otel_token is not None:
+                otel_context.detach(otel_token)
+            if root is not None:
+                root.end()
@@ -1,3 +1,5 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -9,56 +11,11 @@ import re
 BASE_DIR = Path(".").resolve()
 DATA_DIR  = BASE_DIR / "Data_SIH_2025_with_blh"
 
-print("BASE_DIR:", BASE_DIR)
-print("DATA_DIR:", DATA_DIR)
-
 # (We WILL NOT merge coords, just showing how to load them if needed later)
 coords_path = DATA_DIR / "lat_lon_sites.txt"
-print("coords file (for later use only):", coords_path)
-
-# ============================================================
-# 2. Load and combine all site_*_training_data.csv
-# ============================================================
-site_files = sorted(DATA_DIR.glob("site_*_train_data.csv"))
-print(f"Found {len(site_files)} site files.")
-if not site_files:
-    raise FileNotFoundError("No site_*_train_data.csv found in DATA_DIR")
-
-frames = []
-for path in site_files:
-    m = re.search(r"site_(\d+)_train_data\.csv", path.name)
-    if not m:
-        print("Skipping unexpected filename:", path.name)
-        continue
-
-    site_id = int(m.group(1))
-    df_site = pd.read_csv(path)
-
-    # Ensure 'site' column exists and is consistent
-    if "site" not in df_site.columns:
-        df_site["site"] = site_id
-    else:
-        # in case it's float/string, force int
-        df_site["site"] = df_site["site"].astype(int)
-
-    frames.append(df_site)
-
-df = pd.concat(frames, ignore_index=True)
-print("Combined shape:", df.shape)
-print("Columns:", df.columns.tolist())
 
-# ============================================================
-# 3. Build datetime & sort (NO coords merged)
-# ============================================================
-df["datetime"] = pd.to_datetime(
-    df[["year", "month", "day", "hour"]].rename(
-        columns={"year": "year", "month": "month", "day": "day", "hour": "hour"}
-    )
-)
-
-df = df.sort_values(["site", "datetime"]).reset_index(drop=True)
-print("Sample after datetime + sort:")
-print(df.head())
+# Lag / rolling stages: >1 = process pool over sites (one job per site group)
+LAG_WORKERS = 0
 
 # ============================================================
 # 4. Feature engineering helpers (no lat/lon used)
@@ -100,88 +57,211 @@ def add_ratio_features(df):
     return df
 
 
-def add_lagged_features(df, group_cols, target_cols, lag_hours=(1, 2, 3, 6, 12, 24)):
+# Lag and rolling features are computed on plain arrays, one vectorised pass per group
+# (site): the group's rows are a contiguous block of the (group, datetime)-sorted frame,
+# so a lag is a positional shift and a rolling window is a difference of prefix sums.
+def _per_group(df, group_cols, cols, block_fn, workers=LAG_WORKERS):
     """
-    Lags use only past data (shift) -> no leakage.
+    Sort by group and datetime, run block_fn({col: values}) on each group's rows
+    (optionally in a process pool), attach the columns it returns and restore the
+    site/datetime order.
     """
-    df = df.copy()
-    groups = df.groupby(group_cols) if group_cols else [(None, df)]
+    group_cols = list(group_cols or [])
+    df = _sorted(df, group_cols + ["datetime"])
 
-    frames = []
-    for _, sub in groups:
-        sub = sub.sort_values("datetime")
-        for col in target_cols:
-            for lag in lag_hours:
-                sub[f"{col}_lag_{lag}h"] = sub[col].shift(lag)
-        frames.append(sub)
-
-    out = pd.concat(frames, axis=0).sort_values(["site", "datetime"]).reset_index(drop=True)
+    if group_cols:
+        keys = df[group_cols]
+        starts = np.flatnonzero(keys.ne(keys.shift()).any(axis=1).to_numpy())
+    else:
+        starts = np.array([0])
+    bounds = zip(starts, np.r_[starts[1:], len(df)])
+    values = {col: df[col].to_numpy(dtype=np.float64) for col in cols}
+    blocks = [{col: v[a:b] for col, v in values.items()} for a, b in bounds]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(block_fn, blocks))
+    else:
+        parts = [block_fn(block) for block in blocks]
+
+    df = df.assign(**{name: np.concatenate([part[name] for part in parts]) for name in parts[0]})
+    return _sorted(df, ["site", "datetime"])
+
+
+def _sorted(df, keys):
+    """df.sort_values(keys).reset_index(drop=True), without reordering a frame that is already sorted."""
+    if not df["datetime"].isna().any():
+        order = np.lexsort([df[key].to_numpy() for key in reversed(keys)])
+        if (order == np.arange(len(df))).all():
+            return df.reset_index(drop=True)
+    return df.sort_values(keys, kind="stable").reset_index(drop=True)
+
+
+def _shift(x, lag):
+    out = np.full(len(x), np.nan)
+    if lag < len(x):
+        out[lag:] = x[:len(x) - lag]
+    return out
+
+
+def _lag_block(values, lag_hours):
+    return {
+        f"{col}_lag_{lag}h": _shift(x, lag)
+        for col, x in values.items()
+        for lag in lag_hours
+    }
+
+
+def _rolling_block(values, windows):
+    """
+    rolling(w, min_periods=1).mean() / .std() (ddof=1), shifted by 1, for one group.
+
+    Window sums come from cumulative sums of the values and of their squares, centred
+    on the group mean and accumulated in extended precision to keep the cancellation
+    in the variance small. As in pandas, a window of identical values has std exactly
+    0 and mean exactly that value; a run-change counter finds those windows.
+    """
+    out = {}
+    for col, x in values.items():
+        n = len(x)
+        row = np.arange(n)
+        valid = ~np.isnan(x)
+        centre = x[valid].mean() if valid.any() else 0.0
+        d = np.where(valid, x - centre, 0.0).astype(np.longdouble)
+        s1_cum = np.r_[0, np.cumsum(d)]
+        s2_cum = np.r_[0, np.cumsum(d * d)]
+        n_cum = np.r_[0, np.cumsum(valid)]
+        changes = np.r_[0, np.cumsum(np.r_[True, x[1:] != x[:-1]])]
+
+        for w in windows:
+            # Past window of row i: rows [lo, i)
+            lo = row - np.minimum(row, w)
+            k = n_cum[row] - n_cum[lo]
+            s1 = s1_cum[row] - s1_cum[lo]
+            s2 = s2_cum[row] - s2_cum[lo]
+            constant = (k == row - lo) & (changes[row] - changes[np.minimum(lo + 1, row)] == 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = (s1 / k).astype(np.float64) + centre
+                var = (np.maximum(s2 - s1 * s1 / k, 0) / (k - 1)).astype(np.float64)
+            mean = np.where(constant, x[row - 1], mean)
+            var = np.where(constant, 0.0, var)
+            out[f"{col}_rollmean_{w}h"] = np.where(k >= 1, mean, np.nan)
+            out[f"{col}_rollstd_{w}h"] = np.where(k >= 2, np.sqrt(var), np.nan)
     return out
 
 
-def add_rolling_features(df, group_cols, cols, windows=(3, 6, 12, 24)):
+def add_lagged_features(df, group_cols, target_cols, lag_hours=(1, 2, 3, 6, 12, 24), workers=LAG_WORKERS):
+    """
+    Lags use only past data (shift) -> no leakage.
+    """
+    return _per_group(df, group_cols, target_cols, partial(_lag_block, lag_hours=lag_hours), workers)
+
+
+def add_rolling_features(df, group_cols, cols, windows=(3, 6, 12, 24), workers=LAG_WORKERS):
     """
     Rolling mean/std shifted by 1 -> only past window used.
     """
-    df = df.copy()
-    groups = df.groupby(group_cols) if group_cols else [(None, df)]
+    return _per_group(df, group_cols, cols, partial(_rolling_block, windows=windows), workers)
+
+
+def load_site_frames():
+    # ============================================================
+    # 2. Load and combine all site_*_training_data.csv
+    # ============================================================
+    site_files = sorted(DATA_DIR.glob("site_*_train_data.csv"))
+    print(f"Found {len(site_files)} site files.")
+    if not site_files:
+        raise FileNotFoundError("No site_*_train_data.csv found in DATA_DIR")
 
     frames = []
-    for _, sub in groups:
-        sub = sub.sort_values("datetime")
-        for col in cols:
-            for w in windows:
-                rm = sub[col].rolling(window=w, min_periods=1).mean().shift(1)
-                rs = sub[col].rolling(window=w, min_periods=1).std().shift(1)
-                sub[f"{col}_rollmean_{w}h"] = rm
-                sub[f"{col}_rollstd_{w}h"]  = rs
-        frames.append(sub)
-
-    out = pd.concat(frames, axis=0).sort_values(["site", "datetime"]).reset_index(drop=True)
-    return out
+    for path in site_files:
+        m = re.search(r"site_(\d+)_train_data\.csv", path.name)
+        if not m:
+            print("Skipping unexpected filename:", path.name)
+            continue
+
+        site_id = int(m.group(1))
+        df_site = pd.read_csv(path)
+
+        # Ensure 'site' column exists and is consistent
+        if "site" not in df_site.columns:
+            df_site["site"] = site_id
+        else:
+            # in case it's float/string, force int
+            df_site["site"] = df_site["site"].astype(int)
+
+        frames.append(df_site)
+
+    df = pd.concat(frames, ignore_index=True)
+    print("Combined shape:", df.shape)
+    print("Columns:", df.columns.tolist())
+
+    # ============================================================
+    # 3. Build datetime & sort (NO coords merged)
+    # ============================================================
+    df["datetime"] = pd.to_datetime(
+        df[["year", "month", "day", "hour"]].rename(
+            columns={"year": "year", "month": "month", "day": "day", "hour": "hour"}
+        )
+    )
 
-# ============================================================
-# 5. Apply feature engineering
-# ============================================================
-print("Adding time features...")
-df = add_time_features(df)
-
-print("Adding wind/BLH features...")
-df = add_wind_features(df)
-
-print("Adding ratio / chemistry features...")
-df = add_ratio_features(df)
-
-print("Adding lagged target features (by site)...")
-df = add_lagged_features(
-    df,
-    group_cols=["site"],
-    target_cols=["O3_target", "NO2_target"],
-    lag_hours=(1, 2, 3, 6, 12, 24),
-)
-
-print("Adding rolling statistics (by site)...")
-df = add_rolling_features(
-    df,
-    group_cols=["site"],
-    cols=["O3_target", "NO2_target", "O3_forecast", "NO2_forecast"],
-    windows=(3, 6, 12, 24),
-)
-
-before = len(df)
-df = df.dropna().reset_index(drop=True)
-after = len(df)
-print(f"Rows before NA drop: {before} | after: {after} | dropped: {before - after}")
+    df = df.sort_values(["site", "datetime"]).reset_index(drop=True)
+    print("Sample after datetime + sort:")
+    print(df.head())
+    return df
 
-# ============================================================
-# 6. Save engineered dataset (NO coords inside)
-# ============================================================
-ENGINEERED_DATA_PATH = DATA_DIR / "train_dataset_engineered-blh.csv"
+def main():
+    print("BASE_DIR:", BASE_DIR)
+    print("DATA_DIR:", DATA_DIR)
+    print("coords file (for later use only):", coords_path)
+
+    df = load_site_frames()
+
+    # ============================================================
+    # 5. Apply feature engineering
+    # ============================================================
+    print("Adding time features...")
+    df = add_time_features(df)
+
+    print("Adding wind/BLH features...")
+    df = add_wind_features(df)
+
+    print("Adding ratio / chemistry features...")
+    df = add_ratio_features(df)
+
+    print("Adding lagged target features (by site)...")
+    df = add_lagged_features(
+        df,
+        group_cols=["site"],
+        target_cols=["O3_target", "NO2_target"],
+        lag_hours=(1, 2, 3, 6, 12, 24),
+    )
 
-if ENGINEERED_DATA_PATH.exists():
-    print("WARNING: Overwriting existing file:", ENGINEERED_DATA_PATH)
+    print("Adding rolling statistics (by site)...")
+    df = add_rolling_features(
+        df,
+        group_cols=["site"],
+        cols=["O3_target", "NO2_target", "O3_forecast", "NO2_forecast"],
+        windows=(3, 6, 12, 24),
+    )
+
+    before = len(df)
+    df = df.dropna().reset_index(drop=True)
+    after = len(df)
+    print(f"Rows before NA drop: {before} | after: {after} | dropped: {before - after}")
+
+    # ============================================================
+    # 6. Save engineered dataset (NO coords inside)
+    # ============================================================
+    ENGINEERED_DATA_PATH = DATA_DIR / "train_dataset_engineered-blh.csv"
+
+    if ENGINEERED_DATA_PATH.exists():
+        print("WARNING: Overwriting existing file:", ENGINEERED_DATA_PATH)
+
+    df.to_csv(ENGINEERED_DATA_PATH, index=False)
+    print("Saved engineered dataset to:", ENGINEERED_DATA_PATH)
+    return df
 
-df.to_csv(ENGINEERED_DATA_PATH, index=False)
-print("Saved engineered dataset to:", ENGINEERED_DATA_PATH)
 
-df.head()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Process pool for CPU-bound forecast jobs.
+
+Recursive forecasting is pure Python/NumPy work that holds the GIL, so running
+it on the event loop (or even in the threadpool) limits a server process to
+one core. With FORECAST_WORKERS > 0 those jobs are shipped to worker processes
+instead. Each worker imports `server` once and loads the startup snapshot
+(ERA5, site store, sites) and the boosters in its initializer; jobs name a
+module-level function of `server` and get back plain NumPy / list results.
+
+Workers are started with "spawn" by default: forking a process that already
+runs uvicorn, a threadpool and OpenMP (xgboost) threads is not safe. (launcher.py
+forks its uvicorn workers from a master that has loaded the boosters but never
+predicted, so none of those threads exist yet; pools started inside those
+workers still default to "spawn".)
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+logger = logging.getLogger("AirQualityServer")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_size = 0
+
+
+def _init_worker():
+    import server
+
+    server.load_startup_state()
+    # One booster thread per worker: the pool itself provides the parallelism
+    server.load_models(n_jobs=1)
+
+
+def _run(fn_name: str, args: tuple) -> Any:
+    import server
+
+    return getattr(server, fn_name)(*args)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def start(workers: int, start_method: str = "spawn") -> Optional[ProcessPoolExecutor]:
+    """Start the pool and make every worker run its initializer before traffic arrives."""
+    global _pool, _size
+    if workers <= 0:
+        return None
+    ctx = multiprocessing.get_context(start_method)
+    _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker)
+    _size = workers
+    # Submitting one job per worker spawns them all; wait so the initializers run at boot
+    for f in [_pool.submit(_ping) for _ in range(workers)]:
+        f.result()
+    logger.info(f"✅ Forecast process pool ready: {workers} workers ({start_method})")
+    return _pool
+
+
+def shutdown():
+    global _pool, _size
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+    _size = 0
+
+
+def enabled() -> bool:
+    return _pool is not None
+
+
+def size() -> int:
+    return _size
+
+
+async def submit(fn_name: str, *args) -> Any:
+    """Run server.<fn_name>(*args) in a worker process."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, _run, fn_name, args)
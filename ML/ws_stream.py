@@ -0,0 +1,75 @@
+"""
+Backpressured frame sending for WebSocket sessions.
+
+Forecast steps are produced in a worker thread far faster than a slow client can
+read them. Frames go through a bounded queue drained by one sender task per
+socket, so a producer blocks once `max_frames` are waiting. If the queue stays
+full for `timeout` seconds the client is treated as a slow consumer and the
+session is aborted, so it cannot pin server memory or a worker thread
+indefinitely.
+
+Frames are sent as binary WebSocket messages holding orjson-encoded JSON.
+"""
+
+import asyncio
+from typing import Any, Optional
+
+import orjson
+
+_CLOSE = object()
+
+
+class SlowConsumer(Exception):
+    """The client did not drain its send queue in time."""
+
+
+class FrameSender:
+    def __init__(self, websocket, max_frames: int = 64, timeout: float = 10.0):
+        self.websocket = websocket
+        self.timeout = timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_frames)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+        self.frames = 0
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.task = self.loop.create_task(self._run())
+
+    async def send(self, message: Any):
+        if self.task.done():
+            raise SlowConsumer("WebSocket sender stopped")
+        frame = orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY)
+        try:
+            await asyncio.wait_for(self.queue.put(frame), self.timeout)
+        except asyncio.TimeoutError:
+            raise SlowConsumer(f"Send queue full for {self.timeout:g}s")
+
+    def send_threadsafe(self, message: Any):
+        """Blocking send for worker threads (waits while the queue is full)."""
+        asyncio.run_coroutine_threadsafe(self.send(message), self.loop).result()
+
+    async def _run(self):
+        while True:
+            frame = await self.queue.get()
+            if frame is _CLOSE:
+                return
+            await self.websocket.send_bytes(frame)
+            self.frames += 1
+
+    async def stop(self, flush: bool = True):
+        """Send what is queued (unless `flush` is False) and stop the sender task."""
+        if self.task is None or self.task.done():
+            return
+        if flush:
+            try:
+                await asyncio.wait_for(self.queue.put(_CLOSE), self.timeout)
+                await asyncio.wait_for(self.task, self.timeout)
+                return
+            except Exception:
+                pass
+        self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, Exception):
+            pass